@@ -1,30 +1,56 @@
 import argparse
+import asyncio
 import atexit
 import json
 import logging
 import os
 import traceback
 from pathlib import Path
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Set
 
 import discord
 from discord import SyncWebhook
 from discord.ext import commands
+from dotenv import dotenv_values
 from dotenv import load_dotenv
 from marsbots import constants
 from marsbots.models import MarsBotMetadata
 
+from bots.common.channel_policy import MessageFilter
+from bots.common.http import close_session
+
+# Settings each bot reads from its own environment (MarsBot.getenv), besides
+# its token. Everything else is read from the process environment, so bots
+# hosted together have to agree on it.
+PER_BOT_SETTINGS = ("EDEN_API_KEY", "EDEN_API_SECRET", "MINIO_URL")
+
+# Log files already opened by this process, which later bots append to
+_log_files: Set[str] = set()
+
 
 class MarsBot(commands.Bot):
-    def __init__(self, metadata_path: str) -> None:
+    def __init__(
+        self,
+        metadata_path: str,
+        log_name: Optional[str] = None,
+        env: Optional[Mapping[str, str]] = None,
+    ) -> None:
         intents = discord.Intents.default()
+        self.env = os.environ if env is None else env
         self.metadata = self.load_metadata(metadata_path)
         self.set_intents(intents)
-        self.configure_logging()
+        self.configure_logging(log_name or self.metadata.name)
         commands.Bot.__init__(
             self,
             command_prefix=self.metadata.command_prefix,
             intents=intents,
         )
+        self.message_filter: Optional[MessageFilter] = None
         atexit.register(self.post_exit_webhook)
 
     def load_metadata(self, metadata_path: str) -> MarsBotMetadata:
@@ -44,8 +70,8 @@ class MarsBot(commands.Bot):
         if "members" in self.metadata.intents:
             intents.members = True
 
-    def configure_logging(self) -> None:
-        logdir = constants.LOG_DIR / self.metadata.name
+    def configure_logging(self, log_name: str) -> None:
+        logdir = constants.LOG_DIR / log_name
         logfile = str(logdir / "discord.log")
         logdir.mkdir(parents=True, exist_ok=True)
 
@@ -54,9 +80,40 @@ class MarsBot(commands.Bot):
             format="%(asctime)s %(levelname)-8s %(message)s",
             datefmt="%a, %d %b %Y %H:%M:%S",
             filename=logfile,
-            filemode="w",
+            filemode="a" if logfile in _log_files else "w",
             force=True,
         )
+        _log_files.add(logfile)
+
+    def getenv(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return self.env.get(key, default)
+
+    def add_cog(self, cog: commands.Cog, *args, **kwargs) -> None:
+        super().add_cog(cog, *args, **kwargs)
+        self.message_filter = None
+
+    def remove_cog(self, name: str) -> Optional[commands.Cog]:
+        cog = super().remove_cog(name)
+        self.message_filter = None
+        return cog
+
+    def get_message_filter(self) -> MessageFilter:
+        # rebuilt lazily whenever the loaded cogs change
+        if self.message_filter is None:
+            self.message_filter = MessageFilter(
+                cog.channel_policy
+                for cog in self.cogs.values()
+                if getattr(cog, "channel_policy", None) is not None
+            )
+        return self.message_filter
+
+    def dispatch(self, event_name: str, *args, **kwargs) -> None:
+        if event_name in ("message", "message_edit"):
+            # the message is the last argument, the edited one for edits
+            own_id = self.user.id if self.user else None
+            if not self.get_message_filter().check(args[-1], own_id):
+                return
+        super().dispatch(event_name, *args, **kwargs)
 
     async def on_ready(self) -> None:
         print(f"Running {self.metadata.name}...")
@@ -78,6 +135,23 @@ class MarsBot(commands.Bot):
                 logging.error(str(e))
 
 
+def load_cogs(bot: MarsBot, cog_paths: List[str]) -> None:
+    for path in cog_paths:
+        res = bot.load_extension(path)
+        if type(res[path]) != bool:
+            ex = res[path]
+            print(
+                "".join(
+                    traceback.format_exception(
+                        etype=type(ex),
+                        value=ex,
+                        tb=ex.__traceback__,
+                    ),
+                ),
+            )
+            raise Exception(res[path])
+
+
 def start(
     bot_name: str,
     metadata_path: str,
@@ -93,26 +167,87 @@ def start(
     load_dotenv(dotenv_path)
 
     bot = MarsBot(metadata_path)
-    for path in cog_paths:
-        res = bot.load_extension(path)
-        if type(res[path]) != bool:
-            ex = res[path]
-            print(
-                "".join(
-                    traceback.format_exception(
-                        etype=type(ex),
-                        value=ex,
-                        tb=ex.__traceback__,
-                    ),
-                ),
+    load_cogs(bot, cog_paths)
+    bot.run(bot.getenv(bot.metadata.token_env))
+
+
+def start_many(bot_names: List[str], dotenv_path: Optional[str] = None) -> None:
+    # Host several bots in one process and event loop, so they share imports,
+    # HTTP connection pools and the Eden task scheduler.
+    print(f"Launching {len(bot_names)} bots...")
+    if dotenv_path:
+        load_dotenv(dotenv_path)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    bots = []
+    for bot_name in bot_names:
+        bot_dir = Path(__file__).parent / "bots" / bot_name
+        # each bot's .env goes into its own environment, not the process's
+        env = {**os.environ, **get_dotenv(bot_dir / ".env")}
+        bot = MarsBot(bot_dir / "metadata.json", log_name="-".join(bot_names), env=env)
+        bots.append(bot)
+
+    per_bot = {*PER_BOT_SETTINGS, *[bot.metadata.token_env for bot in bots]}
+    # cog modules and shared libraries read the rest when imported or first used
+    os.environ.update(get_shared_settings(bots, per_bot))
+    for bot_name, bot in zip(bot_names, bots):
+        load_cogs(bot, [f"bots.{bot_name}.{bot_name}"])
+
+    try:
+        loop.run_until_complete(
+            run_bots([(bot, bot.getenv(bot.metadata.token_env)) for bot in bots]),
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(close_bots(bots))
+        loop.close()
+
+
+def get_dotenv(path: Path) -> Dict[str, str]:
+    values = dotenv_values(path)
+    return {key: value for key, value in values.items() if value is not None}
+
+
+def get_shared_settings(bots: List[MarsBot], per_bot: Iterable[str]) -> Dict[str, str]:
+    shared = {}
+    keys = set().union(*[bot.env for bot in bots]) - set(per_bot)
+    for key in sorted(keys):
+        # a setting only some of the bots define is simply shared with the rest
+        values = {bot.getenv(key) for bot in bots} - {None, ""}
+        if not values:
+            continue
+        if len(values) > 1:
+            names = ", ".join(bot.metadata.name for bot in bots)
+            raise SystemExit(
+                f"{names} need different values for {key}, which is shared by "
+                "bots in one process. Run them in separate processes.",
             )
-            raise Exception(res[path])
-    bot.run(os.getenv(bot.metadata.token_env))
+        shared[key] = values.pop()
+    return shared
+
+
+async def run_bots(bots: List[tuple]) -> None:
+    await asyncio.gather(*[bot.start(token) for bot, token in bots])
+
+
+async def close_bots(bots: List[MarsBot]) -> None:
+    for bot in bots:
+        if not bot.is_closed():
+            await bot.close()
+    await close_session()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="MarsBot")
-    parser.add_argument("bot_name", help="Name of the bot to load from /bots directory")
+    parser.add_argument(
+        "bot_name",
+        help="Name of the bot to load from /bots directory. Pass several names to "
+        "run them together in a single process.",
+        nargs="+",
+    )
     parser.add_argument("--metadata_path", help="Path to a custom metadata file")
     parser.add_argument(
         "--cog-paths",
@@ -122,4 +257,11 @@ if __name__ == "__main__":
     )
     parser.add_argument("--dotenv-path", help="Path to a custom .env file")
     args = parser.parse_args()
-    start(args.bot_name, args.metadata_path, args.cog_paths, args.dotenv_path)
+    if len(args.bot_name) > 1:
+        if args.metadata_path:
+            parser.error("--metadata_path can only be used with a single bot")
+        if args.cog_paths:
+            parser.error("--cog-paths can only be used with a single bot")
+        start_many(args.bot_name, args.dotenv_path)
+    else:
+        start(args.bot_name[0], args.metadata_path, args.cog_paths, args.dotenv_path)
@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import logging
 import os
 import random
@@ -7,8 +8,6 @@ from typing import Optional
 
 import discord
 from discord.ext import commands
-from marsbots.discord_utils import get_discord_messages
-from marsbots.discord_utils import get_reply_chain
 from marsbots.discord_utils import is_mentioned
 from marsbots.discord_utils import replace_bot_mention
 from marsbots.discord_utils import replace_mentions_with_usernames
@@ -20,18 +19,28 @@ from marsbots_eden.eden import get_file_update
 from marsbots_eden.eden import poll_creation_queue
 from marsbots_eden.eden import request_creation
 
+from bots.common.channel_policy import ChannelPolicy
+from bots.common.completion_cache import CompletionCache
+from bots.common.content_filter import content_filter
+from bots.common.embeddings import try_build_index
+from bots.common.message_cache import ChannelMessageCache
+from bots.common.streaming import stream_completion
+from bots.common.streaming import StreamingReply
+
 from . import config
 from . import prompts
 from . import settings
 
-CONFIG = config.config_dict[config.stage]
-ALLOWED_GUILDS = CONFIG["guilds"]
-ALLOWED_CHANNELS = CONFIG["allowed_channels"]
-ALLOWED_RANDOM_REPLY_CHANNELS = CONFIG["allowed_random_reply_channels"]
-ALLOWED_DM_USERS = CONFIG["allowed_dm_users"]
+POLICY = ChannelPolicy.from_config(config.config_dict[config.stage])
+ALLOWED_GUILDS = list(POLICY.guilds)
+ALLOWED_CHANNELS = POLICY.channels
+ALLOWED_RANDOM_REPLY_CHANNELS = POLICY.random_reply_channels
+ALLOWED_DM_USERS = POLICY.dm_users
 
 
 class Abraham(commands.Cog):
+    channel_policy = POLICY
+
     def __init__(self, bot: commands.bot) -> None:
         self.bot = bot
         self.language_model = OpenAIGPT3LanguageModel(
@@ -40,6 +49,19 @@ class Abraham(commands.Cog):
             frequency_penalty=settings.GPT3_FREQUENCY_PENALTY,
             presence_penalty=settings.GPT3_PRESENCE_PENALTY,
         )
+        self.message_cache = ChannelMessageCache()
+        self.completion_cache = CompletionCache(
+            max_size=settings.COMPLETION_CACHE_SIZE,
+            ttl=settings.COMPLETION_CACHE_TTL,
+            semantic=settings.COMPLETION_CACHE_SEMANTIC,
+            similarity_threshold=settings.COMPLETION_CACHE_SIMILARITY,
+        )
+        self.topic_index = None
+        if settings.TOPIC_ROUTING_ON:
+            self.topic_index = try_build_index(
+                [topic["document"] for topic in prompts.topics],
+                name="abraham-topics",
+            )
 
     @commands.slash_command(guild_ids=ALLOWED_GUILDS)
     async def complete(
@@ -58,7 +80,11 @@ class Abraham(commands.Cog):
             return
         await ctx.defer()
         try:
-            completion = await complete_text(self.language_model, prompt, max_tokens)
+            completion = await self.completion_cache.complete(
+                self.language_model,
+                prompt,
+                max_tokens,
+            )
             formatted = f"**{prompt}**{completion}"
             await ctx.respond(formatted)
         except Exception as e:
@@ -67,12 +93,11 @@ class Abraham(commands.Cog):
 
     @commands.Cog.listener("on_message")
     async def on_message(self, message: discord.Message) -> None:
+        if not POLICY.allows(message.channel.id):
+            return
         try:
-            if (
-                message.channel.id not in ALLOWED_CHANNELS
-                or message.author.id == self.bot.user.id
-                or message.author.bot
-            ):
+            self.message_cache.add(message, live=True)
+            if message.author.bot:
                 return
 
             trigger_reply = is_mentioned(message, self.bot.user) or (
@@ -85,7 +110,10 @@ class Abraham(commands.Cog):
                 async with ctx.channel.typing():
                     #chat = await self.get_chat_messages(ctx, message)
                     prompt = await self.format_prompt(ctx, message)
-                    completion = await complete_text(
+                    if settings.STREAM_REPLIES:
+                        await self.stream_reply(message, prompt)
+                        return
+                    completion = await self.completion_cache.complete(
                         self.language_model,
                         prompt, #chat
                         max_tokens=200,
@@ -98,6 +126,57 @@ class Abraham(commands.Cog):
             print(f"Error: {e}")
             await message.reply(":)")
 
+    async def stream_reply(self, message: discord.Message, prompt: str) -> None:
+        max_tokens = 200
+        stop = ["\n\n", "\n"]
+        completion, vector = await self.completion_cache.lookup(
+            self.language_model,
+            prompt,
+            max_tokens,
+            stop=stop,
+            use_content_filter=True,
+        )
+        if completion is not None:
+            await message.reply(completion.strip())
+            return
+        # nothing is shown before it has passed the content filter; a rejected
+        # stream ends like a non-streamed reply would, retried then refused
+        streaming_reply = StreamingReply(
+            message,
+            is_safe=content_filter.is_safe,
+            fallback=functools.partial(
+                self.completion_cache.complete,
+                self.language_model,
+                prompt,
+                max_tokens,
+                stop=stop,
+                use_content_filter=True,
+            ),
+        )
+        completion, _ = await streaming_reply.stream(
+            stream_completion(self.language_model, prompt, max_tokens, stop=stop),
+        )
+        if streaming_reply.blocked:
+            return
+        self.completion_cache.store(
+            self.language_model,
+            prompt,
+            max_tokens,
+            completion,
+            vector,
+            stop=stop,
+            use_content_filter=True,
+        )
+
+    @commands.Cog.listener("on_message_edit")
+    async def on_message_edit(self, before: discord.Message, after: discord.Message):
+        if POLICY.allows(after.channel.id):
+            self.message_cache.add(after)
+
+    @commands.Cog.listener("on_raw_message_delete")
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.message_cache.remove(payload.channel_id, payload.message_id)
+
     def message_preprocessor(self, message: discord.Message) -> str:
         message_content = replace_bot_mention(message.content, only_first=True)
         message_content = replace_mentions_with_usernames(message_content, message.mentions)
@@ -109,8 +188,10 @@ class Abraham(commands.Cog):
         ctx: commands.context,
         message: discord.Message,
     ) -> str:
-        last_messages = await get_discord_messages(ctx.channel, 1)
-        reply_chain = await get_reply_chain(ctx, message, depth=8)
+        last_messages, reply_chain = await asyncio.gather(
+            self.message_cache.get_last_messages(ctx.channel, 1),
+            self.message_cache.get_reply_chain(message, depth=8),
+        )
         chat = [{
             "role": "system", 
             "content": settings.MANIFEST
@@ -132,10 +213,12 @@ class Abraham(commands.Cog):
         message: discord.Message,
     ) -> str:
         last_message_content = self.message_preprocessor(message)
-        topic_idx = 0 #self.get_similar_topic_idx(last_message_content)
+        topic_idx = await self.get_similar_topic_idx(last_message_content)
         topic_prefix = prompts.topics[topic_idx]["prefix"]
-        last_messages = await get_discord_messages(ctx.channel, 1)
-        reply_chain = await get_reply_chain(ctx, message, depth=8)
+        last_messages, reply_chain = await asyncio.gather(
+            self.message_cache.get_last_messages(ctx.channel, 1),
+            self.message_cache.get_reply_chain(message, depth=8),
+        )
         if reply_chain:
             reply_chain = self.format_reply_chain(reply_chain)
         last_message_text = str(
@@ -174,10 +257,21 @@ class Abraham(commands.Cog):
             )
         return "\n".join([str(message).strip() for message in reply_chain])
 
-    def get_similar_topic_idx(self, query: str) -> int:
-        docs = [topic["document"] for topic in prompts.topics]
-        res = self.language_model.document_search(query, docs)
-        return self.language_model.most_similar_doc_idx(res)
+    async def get_similar_topic_idx(self, query: str) -> int:
+        if not self.topic_index or not query:
+            return 0
+        try:
+            loop = asyncio.get_running_loop()
+            query_vector = await loop.run_in_executor(
+                None,
+                self.topic_index.embed_query,
+                query,
+            )
+        except Exception as e:
+            logging.error(f"Topic routing failed: {e}")
+            return 0
+        topic_idx, _ = self.topic_index.most_similar(query_vector)
+        return topic_idx
 
     async def get_start_gen_message(self, ctx):
         async with ctx.channel.typing():
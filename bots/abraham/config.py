@@ -19,7 +19,9 @@ config_dict = {
         "allowed_random_reply_channels": [
             channels.GENE_GENERAL
         ],
-        "allowed_dm_users": []
+        "allowed_dm_users": [],
+        # other bots' messages are kept as conversation context
+        "allow_bots": True
     },
     "prod": {
         "guilds": [
@@ -73,6 +75,7 @@ config_dict = {
             channels.ABRAHAM_ABRAHAM,
             channels.ABRAHAM_EDEN,
         ],
-        "allowed_dm_users": []
+        "allowed_dm_users": [],
+        "allow_bots": True
     }
 }
@@ -1,11 +1,11 @@
 import asyncio
+import functools
 import os
 import random
 from dataclasses import dataclass
 from typing import Optional
 
 import discord
-import requests
 # from aleph_alpha_client import AlephAlphaClient
 # from aleph_alpha_client import AlephAlphaModel
 # from aleph_alpha_client import CompletionRequest
@@ -18,26 +18,32 @@ from marsbots.discord_utils import replace_mentions_with_usernames
 from marsbots.language_models import OpenAIGPT3LanguageModel
 from marsbots_eden.eden import get_file_update
 from marsbots_eden.eden import poll_creation_queue
-from marsbots_eden.eden import request_creation
 from marsbots_eden.models import SignInCredentials
 from marsbots_eden.models import SourceSettings
 from marsbots_eden.models import StableDiffusionConfig
 
+from bots.common.admission import get_admission_queue
+from bots.common.channel_policy import ChannelPolicy
+from bots.common.content_filter import content_filter
+from bots.common.eden import create_task
+from bots.common.feedback import feedback_queue
+from bots.common.governor import get_governor
+from bots.common.governor import SAFE_RETRY_ERRORS
+from bots.common.message_edits import edit_coalescer
+from bots.common.rate_limit import edit_budget
+
 from . import config
 from . import settings
 
 
 # MINIO_URL = "https://{}/{}".format(os.getenv("MINIO_URL"), os.getenv("BUCKET_NAME"))
-MINIO_URL = "https://{}/{}".format(os.getenv("MINIO_URL"), "creations-stg")
 GATEWAY_URL = "https://gateway-test.abraham.ai"  # os.getenv("GATEWAY_URL")
 MAGMA_TOKEN = os.getenv("MAGMA_API_KEY")
-EDEN_API_KEY = os.getenv("EDEN_API_KEY")
-EDEN_API_SECRET = os.getenv("EDEN_API_SECRET")
 
-CONFIG = config.config_dict[config.stage]
-ALLOWED_GUILDS = CONFIG["guilds"]
-ALLOWED_CHANNELS = CONFIG["allowed_channels"]
-ALLOWED_LERP_BACKDOOR_USERS = CONFIG["allowed_channels"]
+POLICY = ChannelPolicy.from_config(config.config_dict[config.stage])
+ALLOWED_GUILDS = list(POLICY.guilds)
+ALLOWED_CHANNELS = POLICY.channels
+ALLOWED_LERP_BACKDOOR_USERS = POLICY.channels
 
 
 @dataclass
@@ -110,14 +116,11 @@ class CreationActionButtons(discord.ui.View):
     async def feedback(self, stat, interaction):
         ctx = await self.bot.get_application_context(interaction)
         await ctx.defer()
-        requests.post(
-            self.loop_input.gateway_url + "/update_stats",
-            json={
-                "creation": self.creation_sha,
-                "stat": stat,
-                "opperation": "increase",
-                "address": interaction.user.id,
-            },
+        feedback_queue.submit(
+            self.loop_input.gateway_url,
+            self.creation_sha,
+            stat,
+            interaction.user.id,
         )
 
     @discord.ui.button(emoji="🔄", style=discord.ButtonStyle.blurple)
@@ -150,11 +153,19 @@ class CreationActionButtons(discord.ui.View):
 
 
 class ComicsDAO(commands.Cog):
+    channel_policy = POLICY
+
     def __init__(self, bot: commands.bot) -> None:
         self.bot = bot
         self.eden_credentials = SignInCredentials(
-            apiKey=EDEN_API_KEY, apiSecret=EDEN_API_SECRET
+            apiKey=bot.getenv("EDEN_API_KEY"),
+            apiSecret=bot.getenv("EDEN_API_SECRET"),
         )
+        self.minio_url = "https://{}/{}".format(
+            bot.getenv("MINIO_URL"), "creations-stg"
+        )
+        self.admission = get_admission_queue(GATEWAY_URL)
+        self.governor = get_governor(GATEWAY_URL)
         self.language_model = OpenAIGPT3LanguageModel(
             engine=settings.GPT3_ENGINE,
             temperature=settings.GPT3_TEMPERATURE,
@@ -202,7 +213,7 @@ class ComicsDAO(commands.Cog):
             return
 
         if settings.CONTENT_FILTER_ON:
-            if not OpenAIGPT3LanguageModel.content_safe(text_input):
+            if not await content_filter.is_safe(text_input):
                 await ctx.respond(
                     f"Content filter triggered, <@!{ctx.author.id}>. Please don't make me draw that. If you think it was a mistake, modify your prompt slightly and try again.",
                 )
@@ -229,7 +240,7 @@ class ComicsDAO(commands.Cog):
 
         generation_loop_input = GenerationLoopInput(
             gateway_url=GATEWAY_URL,
-            minio_url=MINIO_URL,
+            minio_url=self.minio_url,
             message=message,
             start_bot_message=start_bot_message,
             source=source,
@@ -281,7 +292,7 @@ class ComicsDAO(commands.Cog):
 
         generation_loop_input = GenerationLoopInput(
             gateway_url=GATEWAY_URL,
-            minio_url=MINIO_URL,
+            minio_url=self.minio_url,
             message=message,
             start_bot_message=start_bot_message,
             source=source,
@@ -348,7 +359,7 @@ class ComicsDAO(commands.Cog):
 
         generation_loop_input = GenerationLoopInput(
             gateway_url=GATEWAY_URL,
-            minio_url=MINIO_URL,
+            minio_url=self.minio_url,
             message=message,
             start_bot_message=start_bot_message,
             source=source,
@@ -383,9 +394,7 @@ class ComicsDAO(commands.Cog):
             return
 
         if settings.CONTENT_FILTER_ON:
-            if not OpenAIGPT3LanguageModel.content_safe(
-                text_input1,
-            ) or not OpenAIGPT3LanguageModel.content_safe(text_input2):
+            if not await content_filter.is_safe(text_input1, text_input2):
                 await ctx.respond(
                     f"Content filter triggered, <@!{ctx.author.id}>. Please don't make me draw that. If you think it was a mistake, modify your prompt slightly and try again.",
                 )
@@ -425,7 +434,7 @@ class ComicsDAO(commands.Cog):
 
         generation_loop_input = GenerationLoopInput(
             gateway_url=GATEWAY_URL,
-            minio_url=MINIO_URL,
+            minio_url=self.minio_url,
             message=message,
             start_bot_message=start_bot_message,
             source=source,
@@ -450,16 +459,34 @@ class ComicsDAO(commands.Cog):
         is_video_request = loop_input.is_video_request
         prefer_gif = loop_input.prefer_gif
 
+        ticket = None
         try:
-            task_id = await request_creation(
-                gateway_url, self.eden_credentials, source, config
+            ticket = await self.admission.acquire(
+                source.author_id,
+                source.guild_id,
+                on_position=functools.partial(
+                    self.show_position, message, start_bot_message
+                ),
+            )
+            task_id = await self.governor.call(
+                create_task,
+                gateway_url,
+                self.eden_credentials,
+                source,
+                config,
+                retry_on=SAFE_RETRY_ERRORS,
             )
             current_sha = None
             while True:
-                result, file, sha = await poll_creation_queue(
-                    gateway_url, minio_url, task_id, is_video_request, prefer_gif
+                result, file, sha = await self.governor.call(
+                    poll_creation_queue,
+                    gateway_url,
+                    minio_url,
+                    task_id,
+                    is_video_request,
+                    prefer_gif,
                 )
-                if sha != current_sha:
+                if sha != current_sha and edit_budget.allow_preview(message.channel.id):
                     current_sha = sha
                     message_update = self.get_message_update(result)
                     await self.edit_message(
@@ -469,6 +496,7 @@ class ComicsDAO(commands.Cog):
                         file_update=file,
                     )
                 if result["status"] == "complete":
+                    await edit_budget.acquire_final(message.channel.id)
                     file, sha = await get_file_update(
                         result, minio_url, is_video_request, prefer_gif
                     )
@@ -497,6 +525,9 @@ class ComicsDAO(commands.Cog):
 
         except Exception as e:
             await self.edit_message(message, start_bot_message, f"Error: {e}")
+        finally:
+            if ticket:
+                self.admission.release(ticket)
 
     async def refresh_callback(
         self,
@@ -512,14 +543,9 @@ class ComicsDAO(commands.Cog):
 
     @commands.Cog.listener("on_message")
     async def on_message(self, message: discord.Message) -> None:
+        if not POLICY.accepts(message):
+            return
         try:
-            if (
-                message.channel.id not in ALLOWED_CHANNELS
-                or message.author.id == self.bot.user.id
-                or message.author.bot
-            ):
-                return
-
             trigger_reply = is_mentioned(message, self.bot.user) and message.attachments
 
             if trigger_reply:
@@ -618,6 +644,21 @@ class ComicsDAO(commands.Cog):
         else:
             await ctx.edit(content=message_content)
 
+    async def show_position(
+        self,
+        message: discord.Message,
+        start_bot_message: str,
+        position: int,
+    ) -> None:
+        # like previews, position updates are dropped when edits run short
+        if not edit_budget.allow_preview(message.channel.id):
+            return
+        await self.edit_message(
+            message,
+            start_bot_message,
+            f"_Waiting in line, position **{position}**_",
+        )
+
     async def edit_message(
         self,
         message: discord.Message,
@@ -625,11 +666,14 @@ class ComicsDAO(commands.Cog):
         message_update: str,
         file_update: Optional[discord.File] = None,
     ) -> discord.Message:
+        fields = {}
         if message_update is not None:
-            message_content = f"{start_bot_message}\n{message_update}"
-            await message.edit(content=message_content)
+            fields["content"] = f"{start_bot_message}\n{message_update}"
         if file_update:
-            await message.edit(files=[file_update], attachments=[])
+            fields["files"] = [file_update]
+            fields["attachments"] = []
+        if fields:
+            await edit_coalescer.edit(message, **fields)
 
 
 def setup(bot: commands.Bot) -> None:
@@ -0,0 +1,207 @@
+import asyncio
+from collections import Counter
+from collections import deque
+from typing import Awaitable
+from typing import Callable
+from typing import Deque
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class Ticket:
+    def __init__(self, user_id: int, guild_id: int) -> None:
+        self.user_id = user_id
+        self.guild_id = guild_id
+        self.admitted = False
+        # 1-based rank among waiting tickets, kept up to date by the queue
+        self.position = 0
+        self.moved = asyncio.Event()
+
+
+class _Rotation:
+    """Weighted round-robin order of waiting tickets.
+
+    Guilds take turns, each getting `weight` admissions per turn; within
+    a guild, users take turns one admission at a time, and each user's
+    own tickets are served first come first served.
+    """
+
+    def __init__(self) -> None:
+        self.guilds: Deque[int] = deque()
+        self.users: Dict[int, Deque[int]] = {}
+        self.tickets: Dict[Tuple[int, int], Deque[Ticket]] = {}
+        self.credits: Dict[int, int] = {}
+
+    def copy(self) -> "_Rotation":
+        rotation = _Rotation()
+        rotation.guilds = deque(self.guilds)
+        rotation.users = {guild: deque(users) for guild, users in self.users.items()}
+        rotation.tickets = {key: deque(queue) for key, queue in self.tickets.items()}
+        rotation.credits = dict(self.credits)
+        return rotation
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self.tickets.values())
+
+    def push(self, ticket: Ticket) -> None:
+        guild, user = ticket.guild_id, ticket.user_id
+        if guild not in self.users:
+            self.guilds.append(guild)
+            self.users[guild] = deque()
+        if (guild, user) not in self.tickets:
+            self.users[guild].append(user)
+            self.tickets[guild, user] = deque()
+        self.tickets[guild, user].append(ticket)
+
+    def remove(self, ticket: Ticket) -> None:
+        queue = self.tickets.get((ticket.guild_id, ticket.user_id))
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self._prune(ticket.guild_id, ticket.user_id)
+
+    def pop(
+        self,
+        weight: Callable[[int], int],
+        allowed: Callable[[Ticket], bool] = lambda ticket: True,
+    ) -> Optional[Ticket]:
+        for guild in list(self.guilds):
+            for user in list(self.users[guild]):
+                ticket = self.tickets[guild, user][0]
+                if not allowed(ticket):
+                    continue
+                self.tickets[guild, user].popleft()
+                self.users[guild].remove(user)
+                self.users[guild].append(user)
+                credits = self.credits.get(guild, weight(guild)) - 1
+                self.credits[guild] = credits
+                if credits <= 0:
+                    del self.credits[guild]
+                    self.guilds.remove(guild)
+                    self.guilds.append(guild)
+                self._prune(guild, user)
+                return ticket
+        return None
+
+    def _prune(self, guild: int, user: int) -> None:
+        if self.tickets[guild, user]:
+            return
+        del self.tickets[guild, user]
+        self.users[guild].remove(user)
+        if not self.users[guild]:
+            del self.users[guild]
+            self.guilds.remove(guild)
+            self.credits.pop(guild, None)
+
+
+class FairShareQueue:
+    """Admission queue for generation requests.
+
+    At most `max_running` generations run at once, at most
+    `max_per_user` per user and `max_per_guild` per guild. Waiting
+    requests are admitted in weighted round-robin order across guilds
+    and users, so a single busy user can't starve everyone else.
+    """
+
+    def __init__(
+        self,
+        max_running: int = 16,
+        max_per_user: int = 2,
+        max_per_guild: int = 8,
+        guild_weights: Optional[Dict[int, int]] = None,
+    ) -> None:
+        self.max_running = max_running
+        self.max_per_user = max_per_user
+        self.max_per_guild = max_per_guild
+        self.guild_weights = guild_weights or {}
+        self.running = 0
+        self._running_users: Counter = Counter()
+        self._running_guilds: Counter = Counter()
+        self._waiting = _Rotation()
+
+    def weight(self, guild_id: int) -> int:
+        return max(1, self.guild_weights.get(guild_id, 1))
+
+    def can_run(self, ticket: Ticket) -> bool:
+        return (
+            self.running < self.max_running
+            and self._running_users[ticket.user_id] < self.max_per_user
+            and self._running_guilds[ticket.guild_id] < self.max_per_guild
+        )
+
+    def position(self, ticket: Ticket) -> int:
+        return ticket.position
+
+    async def acquire(
+        self,
+        user_id: int,
+        guild_id: int,
+        on_position: Optional[PositionCallback] = None,
+    ) -> Ticket:
+        ticket = Ticket(user_id, guild_id)
+        self._waiting.push(ticket)
+        self._dispatch()
+        position = None
+        try:
+            while not ticket.admitted:
+                ticket.moved.clear()
+                if on_position and ticket.position != position:
+                    position = ticket.position
+                    await on_position(position)
+                    # the ticket may have moved again in the meantime
+                    continue
+                await ticket.moved.wait()
+        except BaseException:
+            self.release(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.admitted:
+            ticket.admitted = False
+            self.running -= 1
+            self._running_users[ticket.user_id] -= 1
+            self._running_guilds[ticket.guild_id] -= 1
+            # drop zero counts so idle users and guilds don't accumulate
+            self._running_users += Counter()
+            self._running_guilds += Counter()
+        else:
+            self._waiting.remove(ticket)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while True:
+            ticket = self._waiting.pop(self.weight, self.can_run)
+            if ticket is None:
+                break
+            ticket.admitted = True
+            self.running += 1
+            self._running_users[ticket.user_id] += 1
+            self._running_guilds[ticket.guild_id] += 1
+            ticket.moved.set()
+        self._update_positions()
+
+    def _update_positions(self) -> None:
+        # estimate: the order tickets would be admitted in if no caps applied.
+        # One pass ranks every waiter, and only those whose rank changed wake up.
+        waiting = self._waiting.copy()
+        position = 0
+        while True:
+            ticket = waiting.pop(self.weight)
+            if ticket is None:
+                break
+            position += 1
+            if ticket.position != position:
+                ticket.position = position
+                ticket.moved.set()
+
+
+_queues: Dict[str, FairShareQueue] = {}
+
+
+def get_admission_queue(api_url: str) -> FairShareQueue:
+    if api_url not in _queues:
+        _queues[api_url] = FairShareQueue()
+    return _queues[api_url]
@@ -0,0 +1,94 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+
+class AssistantBusy(Exception):
+    pass
+
+
+class AssistantGateway:
+    """Runs blocking assistant calls on a worker pool.
+
+    Calls for different sessions run in parallel, calls within one session
+    run one at a time in arrival order. Once `max_queue_depth` calls are
+    waiting or running, new calls fail fast with AssistantBusy.
+    """
+
+    def __init__(
+        self,
+        assistant: Callable[..., Any],
+        max_workers: int = 4,
+        max_queue_depth: int = 32,
+    ) -> None:
+        self.assistant = assistant
+        self.max_queue_depth = max_queue_depth
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="assistant",
+        )
+        self.pending = 0
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._session_pending: Dict[str, int] = {}
+
+    async def __call__(self, message: Any, session_id: str) -> Any:
+        if self.pending >= self.max_queue_depth:
+            raise AssistantBusy(f"{self.pending} assistant calls already queued")
+        self.pending += 1
+        lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        self._session_pending[session_id] = self._session_pending.get(session_id, 0) + 1
+        try:
+            async with lock:
+                loop = asyncio.get_running_loop()
+                call = functools.partial(self.assistant, message, session_id=session_id)
+                return await loop.run_in_executor(self.executor, call)
+        finally:
+            self.pending -= 1
+            self._session_pending[session_id] -= 1
+            if not self._session_pending[session_id]:
+                del self._session_pending[session_id]
+                del self._session_locks[session_id]
+
+
+def get_assistant_message(
+    prompt: str,
+    attachment_urls: List[str],
+) -> Tuple[dict, Dict[str, str]]:
+    # the assistant refers to attachments by file name, so also return the
+    # lookup back to their urls
+    attachment_lookup_file = {
+        url: f"/files/image{i+1}.jpeg" for i, url in enumerate(attachment_urls)
+    }
+    attachment_lookup_url = {v: k for k, v in attachment_lookup_file.items()}
+    assistant_message = {
+        "prompt": prompt,
+        "attachments": [attachment_lookup_file[url] for url in attachment_urls],
+    }
+    return assistant_message, attachment_lookup_url
+
+
+def parse_assistant_config(
+    config: dict,
+    attachment_lookup_url: Dict[str, str],
+) -> Tuple[str, str, dict]:
+    """Splits the assistant's config into its mode, a title and config fields."""
+    config = dict(config)
+    mode = config.pop("generator")
+    if "text_input" in config:
+        text_input = config["text_input"]
+    elif "interpolation_texts" in config:
+        text_input = " to ".join(config["interpolation_texts"])
+    else:
+        text_input = mode
+    if "init_image_data" in config:
+        config["init_image_data"] = attachment_lookup_url[config["init_image_data"]]
+    if "interpolation_init_images" in config:
+        config["interpolation_init_images"] = [
+            attachment_lookup_url[img] for img in config["interpolation_init_images"]
+        ]
+    return mode, text_input, config
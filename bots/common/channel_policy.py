@@ -0,0 +1,114 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
+from typing import Dict
+from typing import FrozenSet
+from typing import Iterable
+from typing import Optional
+
+import discord
+
+
+@dataclass(frozen=True)
+class ChannelPolicy:
+    """Where a bot is allowed to act, compiled from its config.config_dict.
+
+    Everything is a frozenset so checks cost the same however many
+    channels a bot is allowed in.
+    """
+
+    guilds: FrozenSet[int] = frozenset()
+    channels: FrozenSet[int] = frozenset()
+    random_reply_channels: FrozenSet[int] = frozenset()
+    dm_users: FrozenSet[int] = frozenset()
+    # channels where the cog wants to see other bots' messages too
+    bot_channels: FrozenSet[int] = frozenset()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ChannelPolicy":
+        channels = frozenset(config.get("allowed_channels", ()))
+        # "allow_bots" is either a flag for all allowed channels or a list
+        allow_bots = config.get("allow_bots", False)
+        if isinstance(allow_bots, bool):
+            bot_channels = channels if allow_bots else frozenset()
+        else:
+            bot_channels = frozenset(allow_bots) & channels
+        return cls(
+            guilds=frozenset(config.get("guilds", ())),
+            channels=channels,
+            random_reply_channels=frozenset(
+                config.get("allowed_random_reply_channels", ()),
+            ),
+            dm_users=frozenset(config.get("allowed_dm_users", ())),
+            bot_channels=bot_channels,
+        )
+
+    def allows(self, channel_id: int) -> bool:
+        return channel_id in self.channels
+
+    def allows_bots(self, channel_id: int) -> bool:
+        return channel_id in self.bot_channels
+
+    def accepts(self, message: discord.Message) -> bool:
+        # the early exit for on_message listeners: an allowed channel and a
+        # human author, which also rules out the bot's own messages
+        return message.channel.id in self.channels and not message.author.bot
+
+
+class MessageFilter:
+    """Drops message events that no loaded cog would act on.
+
+    Compiled from the ChannelPolicy of every loaded cog and applied in
+    MarsBot.dispatch, before the events fan out to listeners and the
+    command parser. The bot's own messages always pass, since some cogs
+    keep them as conversation context; other bots' messages only pass in
+    channels whose policy allows bots.
+    """
+
+    def __init__(
+        self,
+        policies: Iterable[ChannelPolicy],
+        report_interval: float = 60,
+    ) -> None:
+        policies = list(policies)
+        # bots whose cogs don't declare a policy see everything, as before
+        self.enabled = bool(policies)
+        self.channels = frozenset().union(*(p.channels for p in policies))
+        self.dm_users = frozenset().union(*(p.dm_users for p in policies))
+        self.bot_channels = frozenset().union(*(p.bot_channels for p in policies))
+        self.report_interval = report_interval
+        self.rejected = 0
+        self._window_start = time.monotonic()
+
+    def accepts(self, message: discord.Message, own_id: Optional[int]) -> bool:
+        if not self.enabled:
+            return True
+        author = message.author
+        if author.id == own_id:
+            return True
+        if author.bot:
+            return message.channel.id in self.bot_channels
+        if message.channel.id in self.channels:
+            return True
+        return message.guild is None and author.id in self.dm_users
+
+    def check(self, message: discord.Message, own_id: Optional[int]) -> bool:
+        accepted = self.accepts(message, own_id)
+        if not accepted:
+            self.rejected += 1
+        self._report()
+        return accepted
+
+    def _report(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.report_interval:
+            return
+        if self.rejected:
+            rate = self.rejected / elapsed
+            logging.info(
+                f"Message filter rejected {self.rejected} events ({rate:.2f}/s)",
+            )
+        self.rejected = 0
+        self._window_start = now
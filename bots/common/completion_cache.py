@@ -0,0 +1,168 @@
+import asyncio
+import dataclasses
+import hashlib
+import json
+import logging
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from marsbots.language_models import complete_text
+from marsbots.language_models import OpenAIGPT3LanguageModel
+
+from .cache import TTLCache
+from .embeddings import embed
+
+
+def estimate_tokens(text: str) -> int:
+    # rough GPT estimate of ~4 characters per token
+    return max(1, len(text) // 4)
+
+
+def sha256(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+class CompletionCache:
+    """Caches completions by engine, sampling parameters and prompt hash.
+
+    With `semantic` on, a miss falls back to the most similar cached prompt
+    with the same engine and parameters, if its embedding similarity is at
+    least `similarity_threshold`.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float = 60 * 60,
+        semantic: bool = False,
+        similarity_threshold: float = 0.97,
+        report_every: int = 100,
+    ) -> None:
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self.report_every = report_every
+        self.semantic_hits = 0
+        self.saved_tokens = 0
+        self._vectors: Dict[str, Tuple[str, np.ndarray]] = {}
+
+    def stats(self) -> dict:
+        lookups = self.cache.hits + self.cache.misses
+        hits = self.cache.hits + self.semantic_hits
+        return {
+            "hits": self.cache.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": lookups - hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_tokens": self.saved_tokens,
+        }
+
+    def params_key(
+        self,
+        language_model: OpenAIGPT3LanguageModel,
+        max_tokens: int,
+        kwargs: dict,
+    ) -> str:
+        # the model's engine and sampling settings (temperature, top_p, ...)
+        params = {
+            **dataclasses.asdict(language_model.settings),
+            "max_tokens": max_tokens,
+            **kwargs,
+        }
+        return sha256(json.dumps(params, sort_keys=True, default=str))
+
+    def key(
+        self,
+        language_model: OpenAIGPT3LanguageModel,
+        prompt: str,
+        max_tokens: int,
+        kwargs: dict,
+    ) -> Tuple[str, str]:
+        params_key = self.params_key(language_model, max_tokens, kwargs)
+        return params_key, f"{params_key}:{sha256(prompt)}"
+
+    async def lookup(
+        self,
+        language_model: OpenAIGPT3LanguageModel,
+        prompt: str,
+        max_tokens: int,
+        **kwargs,
+    ) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        params_key, key = self.key(language_model, prompt, max_tokens, kwargs)
+        completion = self.cache.get(key)
+        vector = None
+        if completion is None and self.semantic:
+            vector = await self._embed(prompt)
+            completion = self._semantic_lookup(params_key, vector)
+        if completion is not None:
+            self.saved_tokens += estimate_tokens(prompt) + estimate_tokens(completion)
+        self._report()
+        return completion, vector
+
+    def store(
+        self,
+        language_model: OpenAIGPT3LanguageModel,
+        prompt: str,
+        max_tokens: int,
+        completion: str,
+        vector: Optional[np.ndarray] = None,
+        **kwargs,
+    ) -> None:
+        params_key, key = self.key(language_model, prompt, max_tokens, kwargs)
+        self.cache.set(key, completion)
+        if vector is not None:
+            self._vectors[key] = (params_key, vector)
+
+    async def complete(
+        self,
+        language_model: OpenAIGPT3LanguageModel,
+        prompt: str,
+        max_tokens: int,
+        **kwargs,
+    ) -> str:
+        completion, vector = await self.lookup(
+            language_model, prompt, max_tokens, **kwargs
+        )
+        if completion is None:
+            completion = await complete_text(
+                language_model, prompt, max_tokens, **kwargs
+            )
+            self.store(
+                language_model, prompt, max_tokens, completion, vector, **kwargs
+            )
+        return completion
+
+    async def _embed(self, prompt: str):
+        try:
+            loop = asyncio.get_running_loop()
+            return (await loop.run_in_executor(None, embed, [prompt]))[0]
+        except Exception as e:
+            logging.error(f"Unable to embed prompt for completion cache: {e}")
+            return None
+
+    def _semantic_lookup(self, params_key: str, vector):
+        if vector is None:
+            return None
+        # forget vectors whose completions were evicted or expired
+        self._vectors = {k: v for k, v in self._vectors.items() if k in self.cache}
+        candidates = [
+            (key, candidate)
+            for key, (candidate_params, candidate) in self._vectors.items()
+            if candidate_params == params_key
+        ]
+        if not candidates:
+            return None
+        scores = np.stack([candidate for _, candidate in candidates]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        self.semantic_hits += 1
+        # already counted as a miss by the exact lookup, so don't count it again
+        return self.cache.peek(candidates[best][0])
+
+    def _report(self) -> None:
+        lookups = self.cache.hits + self.cache.misses
+        if self.report_every and lookups % self.report_every == 0:
+            logging.info(f"Completion cache: {self.stats()}")
@@ -0,0 +1,60 @@
+import asyncio
+from typing import Callable
+from typing import Dict
+
+from marsbots.language_models import OpenAIGPT3LanguageModel
+
+from .cache import TTLCache
+
+
+def normalize_prompt(text: str) -> str:
+    return " ".join(str(text).split()).casefold()
+
+
+class ContentFilter:
+    """Async front for the (blocking) content filter.
+
+    Checks run in the default executor and concurrently with each other.
+    Verdicts are cached by normalized prompt text, and concurrent checks of
+    the same prompt share a single request.
+    """
+
+    def __init__(
+        self,
+        check: Callable[[str], bool] = OpenAIGPT3LanguageModel.content_safe,
+        max_size: int = 4096,
+        ttl: float = 24 * 60 * 60,
+    ) -> None:
+        self.check = check
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def hits(self) -> int:
+        return self.cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self.cache.misses
+
+    async def is_safe(self, *texts: str) -> bool:
+        results = await asyncio.gather(*[self._is_safe(text) for text in texts])
+        return all(results)
+
+    async def _is_safe(self, text: str) -> bool:
+        key = normalize_prompt(text)
+        safe = self.cache.get(key)
+        if safe is not None:
+            return safe
+        if key not in self._in_flight:
+            loop = asyncio.get_running_loop()
+            self._in_flight[key] = loop.run_in_executor(None, self.check, text)
+        try:
+            safe = await asyncio.shield(self._in_flight[key])
+        finally:
+            self._in_flight.pop(key, None)
+        self.cache.set(key, safe)
+        return safe
+
+
+content_filter = ContentFilter()
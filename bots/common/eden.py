@@ -0,0 +1,62 @@
+from typing import Dict
+from typing import List
+
+from marsbots_eden.models import SignInCredentials
+from marsbots_eden.models import SourceSettings
+from marsbots_eden.models import StableDiffusionConfig
+
+from .governor import EdenOverloaded
+from .governor import is_retryable_status
+from .http import get_session
+
+
+def get_headers(credentials: SignInCredentials) -> Dict[str, str]:
+    return {
+        "x-api-key": credentials.apiKey,
+        "x-api-secret": credentials.apiSecret,
+    }
+
+
+async def create_task(
+    api_url: str,
+    credentials: SignInCredentials,
+    source: SourceSettings,
+    config: StableDiffusionConfig,
+) -> str:
+    # same request as marsbots_eden's request_creation, but overload statuses
+    # raise EdenOverloaded so the governor can retry them and count them
+    session = get_session()
+    async with session.post(
+        api_url + "/tasks/create",
+        json={
+            "generatorName": config.generator_name,
+            "config": config.dict(),
+            "metadata": source.dict(),
+        },
+        headers=get_headers(credentials),
+    ) as response:
+        if is_retryable_status(response.status):
+            raise EdenOverloaded(response.status, await response.text())
+        if response.status != 200:
+            raise Exception(await response.text())
+        result = await response.json()
+        return result["taskId"]
+
+
+async def fetch_tasks(
+    api_url: str,
+    credentials: SignInCredentials,
+    task_ids: List[str],
+) -> List[dict]:
+    session = get_session()
+    async with session.post(
+        api_url + "/tasks/fetch",
+        json={"taskIds": task_ids},
+        headers=get_headers(credentials),
+    ) as response:
+        if is_retryable_status(response.status):
+            raise EdenOverloaded(response.status, await response.text())
+        if response.status != 200:
+            raise Exception(await response.text())
+        result = await response.json()
+        return result["tasks"]
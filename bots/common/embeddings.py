@@ -0,0 +1,76 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import openai
+
+EMBEDDING_ENGINE = "text-embedding-ada-002"
+
+# Kept outside of bots/ so that writing the cache doesn't trigger superfsmon
+EMBEDDING_CACHE_DIR = Path(
+    os.getenv("EMBEDDING_CACHE_DIR", "/tmp/marsbots/embeddings"),
+)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def embed(texts: List[str], engine: str = EMBEDDING_ENGINE) -> np.ndarray:
+    response = openai.Embedding.create(input=texts, engine=engine)
+    data = sorted(response["data"], key=lambda item: item["index"])
+    vectors = np.array([item["embedding"] for item in data], dtype=np.float32)
+    return normalize(vectors)
+
+
+class EmbeddingIndex:
+    """Unit-normalized document embeddings, scored with one matrix product."""
+
+    def __init__(self, vectors: np.ndarray, engine: str = EMBEDDING_ENGINE) -> None:
+        self.vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        self.engine = engine
+
+    @classmethod
+    def build(
+        cls,
+        documents: List[str],
+        name: str,
+        engine: str = EMBEDDING_ENGINE,
+    ) -> "EmbeddingIndex":
+        # cache file is keyed by the documents, so editing them re-embeds
+        digest = hashlib.sha256("\n".join([engine, *documents]).encode()).hexdigest()
+        cache_path = EMBEDDING_CACHE_DIR / f"{name}-{digest[:16]}.npy"
+        if cache_path.exists():
+            return cls(np.load(cache_path), engine)
+        vectors = embed(documents, engine)
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(cache_path, vectors)
+        except OSError as e:
+            logging.error(f"Unable to cache embeddings: {e}")
+        return cls(vectors, engine)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return embed([query], self.engine)[0]
+
+    def scores(self, query_vector: np.ndarray) -> np.ndarray:
+        return self.vectors @ query_vector
+
+    def most_similar(self, query_vector: np.ndarray) -> Tuple[int, float]:
+        scores = self.scores(query_vector)
+        idx = int(np.argmax(scores))
+        return idx, float(scores[idx])
+
+
+def try_build_index(documents: List[str], name: str) -> Optional[EmbeddingIndex]:
+    try:
+        return EmbeddingIndex.build(documents, name)
+    except Exception as e:
+        logging.error(f"Unable to build embedding index {name}: {e}")
+        return None
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional
+from typing import Tuple
+
+from .http import get_session
+
+FeedbackKey = Tuple[str, str, str, int]
+
+
+class StatsFeedbackQueue:
+    """Bounded background queue for /update_stats calls (burn, praise).
+
+    Button handlers only enqueue. Identical updates (same creation, stat
+    and user) that arrive before the next flush are coalesced into one,
+    and pending updates are posted in batches over the pooled session.
+    """
+
+    def __init__(
+        self,
+        max_pending: int = 1000,
+        max_batch: int = 50,
+        flush_interval: float = 2,
+    ) -> None:
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.coalesced = 0
+        self.dropped = 0
+        self._pending: "OrderedDict[FeedbackKey, dict]" = OrderedDict()
+        self._worker: Optional[asyncio.Task] = None
+
+    def submit(self, api_url: str, creation: str, stat: str, address: int) -> bool:
+        key = (api_url, creation, stat, address)
+        if key in self._pending:
+            self.coalesced += 1
+            return True
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            logging.warning(f"Feedback queue full, dropping {stat} for {creation}")
+            return False
+        self._pending[key] = {
+            "creation": creation,
+            "stat": stat,
+            "opperation": "increase",
+            "address": address,
+        }
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return True
+
+    async def _run(self) -> None:
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        batch = []
+        while self._pending and len(batch) < self.max_batch:
+            batch.append(self._pending.popitem(last=False))
+        await asyncio.gather(
+            *[self._post(api_url, payload) for (api_url, *_), payload in batch],
+        )
+
+    async def _post(self, api_url: str, payload: dict) -> None:
+        try:
+            session = get_session()
+            url = api_url + "/update_stats"
+            async with session.post(url, json=payload) as response:
+                if response.status != 200:
+                    logging.error(f"Error updating stats: {await response.text()}")
+        except Exception as e:
+            logging.error(f"Error updating stats: {e}")
+
+
+feedback_queue = StatsFeedbackQueue()
@@ -0,0 +1,629 @@
+import asyncio
+import dataclasses
+import functools
+import logging
+import random
+from dataclasses import dataclass
+from dataclasses import field
+from types import MappingProxyType
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+
+import discord
+from discord.ext import commands
+from marsbots_eden.models import SignInCredentials
+from marsbots_eden.models import SourceSettings
+from marsbots_eden.models import StableDiffusionConfig
+
+from .admission import get_admission_queue
+from .admission import Ticket
+from .feedback import feedback_queue
+from .journal import dump_job
+from .journal import fetch_message
+from .journal import JobJournal
+from .lora_routing import get_lora_router
+from .lora_routing import LoraProfile
+from .lora_routing import LoraRouter
+from .media import Attachment
+from .media import get_output_url
+from .media import media_cache
+from .message_edits import edit_coalescer
+from .polling import PollingPolicy
+from .previews import preview_renderer
+from .rate_limit import edit_budget
+from .scheduler import get_scheduler
+from .transcode import transcoder
+
+Size = Tuple[int, int]
+
+IMAGE_DIMENSIONS: Dict[str, Size] = {
+    "square": (768, 768),
+    "landscape": (960, 640),
+    "portrait": (640, 960),
+}
+VIDEO_DIMENSIONS: Dict[str, Size] = {
+    "square": (1024, 1024),
+    "landscape": (1280, 768),
+    "portrait": (768, 1280),
+}
+
+
+def random_seed() -> int:
+    return random.randint(1, 1e8)
+
+
+@dataclass(frozen=True)
+class CommandProfile:
+    generator_name: str
+    steps: Optional[int] = None
+    size: Optional[Size] = None
+    dimensions: Mapping[str, Size] = field(default_factory=dict)
+    params: Mapping[str, Any] = field(default_factory=dict)
+    # False to always use the bot's first LoRA, regardless of triggers
+    lora_on_trigger: bool = True
+
+    def with_params(self, **params) -> "CommandProfile":
+        return dataclasses.replace(self, params={**self.params, **params})
+
+    def get_size(self, aspect_ratio: Optional[str] = None) -> Size:
+        return self.dimensions[aspect_ratio] if aspect_ratio else self.size
+
+
+CREATE = CommandProfile(
+    "create",
+    steps=40,
+    dimensions=IMAGE_DIMENSIONS,
+    params={"guidance_scale": 7.5, "upscale_f": 1.0},
+)
+REMIX = CommandProfile(
+    "remix",
+    steps=50,
+    size=(1024, 1024),
+    params={
+        "text_input": "remix",
+        "init_image_strength": 0.125,
+        "guidance_scale": 7.5,
+    },
+    lora_on_trigger=False,
+)
+REAL2REAL = CommandProfile(
+    "real2real",
+    steps=40,
+    size=(768, 768),
+    params={
+        "stream": True,
+        "stream_every": 1,
+        "text_input": "real2real",
+        "interpolation_init_images_use_img2txt": True,
+        "n_frames": 50,
+        "loop": True,
+        "smooth": True,
+        "n_film": 1,
+        "guidance_scale": 6.5,
+        # a higher value will make the video smoother, but allows less visual
+        # change / journey
+        "interpolation_init_images_min_strength": 0.3,
+    },
+    lora_on_trigger=False,
+)
+LERP = CommandProfile(
+    "interpolate",
+    steps=40,
+    dimensions=VIDEO_DIMENSIONS,
+    params={
+        "stream": True,
+        "stream_every": 1,
+        "n_frames": 50,
+        "smooth": True,
+        "loop": True,
+        "n_film": 1,
+        "sampler": "euler",
+        "guidance_scale": 7.5,
+    },
+)
+# "Lerp It" button, continuing from an existing creation
+LERP_IT = CommandProfile(
+    "interpolate",
+    params={"stream": True, "stream_every": 1, "n_frames": 50},
+)
+
+
+COMMANDS = ("create", "remix", "real2real", "lerp", "lerp_it")
+
+
+@dataclass(frozen=True)
+class CommandTemplate:
+    """A command's config with everything but the request's fields filled in."""
+
+    # keyed by aspect ratio, and by None for the command's fixed size
+    configs: Mapping[Optional[str], Mapping[str, Any]]
+    router: LoraRouter
+    lora_on_trigger: bool = True
+
+    @classmethod
+    def compile(
+        cls,
+        command: CommandProfile,
+        router: LoraRouter,
+    ) -> "CommandTemplate":
+        params = {"generator_name": command.generator_name, **command.params}
+        if command.steps is not None:
+            params["steps"] = command.steps
+        configs = {}
+        for aspect_ratio in [None, *command.dimensions]:
+            config = dict(params)
+            size = command.get_size(aspect_ratio)
+            if size is not None:
+                config["width"], config["height"] = size
+            # fail when the profile is loaded rather than on the first request
+            StableDiffusionConfig(**config)
+            configs[aspect_ratio] = MappingProxyType(config)
+        return cls(MappingProxyType(configs), router, command.lora_on_trigger)
+
+    def render(
+        self,
+        texts: List[str],
+        aspect_ratio: Optional[str] = None,
+        **fields,
+    ) -> StableDiffusionConfig:
+        config = dict(self.configs[aspect_ratio])
+        if self.lora_on_trigger:
+            lora = self.router.match(texts)
+        else:
+            lora = self.router.primary
+        if lora:
+            config["lora"] = lora.lora_id
+            config["lora_scale"] = lora.scale
+        config.update(fields)
+        return StableDiffusionConfig(**config)
+
+
+@dataclass(frozen=True)
+class CompiledProfile:
+    name: str
+    loras: Tuple[LoraProfile, ...]
+    create: CommandTemplate
+    remix: CommandTemplate
+    real2real: CommandTemplate
+    lerp: CommandTemplate
+    lerp_it: CommandTemplate
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """Everything that differs between the bots' generation commands."""
+
+    name: str
+    loras: Tuple[LoraProfile, ...] = ()
+    create: CommandProfile = CREATE
+    remix: CommandProfile = REMIX
+    real2real: CommandProfile = REAL2REAL
+    lerp: CommandProfile = LERP
+    lerp_it: CommandProfile = LERP_IT
+
+    def compile(self) -> CompiledProfile:
+        # bots with the same LoRAs share one compiled router
+        router = get_lora_router(self.loras)
+        templates = {
+            command: CommandTemplate.compile(getattr(self, command), router)
+            for command in COMMANDS
+        }
+        return CompiledProfile(self.name, self.loras, **templates)
+
+
+@dataclass
+class GenerationLoopInput:
+    api_url: str
+    start_bot_message: str
+    source: SourceSettings
+    config: any
+    message: discord.Message
+    is_video_request: bool = False
+    prefer_gif: bool = True
+    polling_policy: PollingPolicy = field(default_factory=PollingPolicy)
+    parent_message: discord.Message = None
+
+
+def get_source(ctx) -> SourceSettings:
+    return SourceSettings(
+        author_id=int(ctx.author.id),
+        author_name=str(ctx.author),
+        guild_id=int(ctx.guild.id),
+        guild_name=str(ctx.guild),
+        channel_id=int(ctx.channel.id),
+        channel_name=str(ctx.channel),
+    )
+
+
+class LerpModal(discord.ui.Modal):
+    def __init__(self, engine, loop_input, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.engine = engine
+        self.loop_input = loop_input
+        self.add_item(discord.ui.InputText(label="Short Input"))
+
+    async def callback(self, interaction: discord.Interaction):
+        ctx = await self.engine.bot.get_application_context(interaction)
+        await ctx.defer()
+        config = self.engine.lerp_it_config(
+            self.loop_input.config,
+            self.children[0].value,
+        )
+        await self.engine.refresh_callback(
+            self.loop_input,
+            config,
+            is_video_request=True,
+        )
+
+
+class CreationActionButtons(discord.ui.View):
+    def __init__(
+        self,
+        *items,
+        engine,
+        output_url,
+        loop_input: GenerationLoopInput,
+        timeout=180,
+    ):
+        super().__init__(*items, timeout=timeout)
+        self.engine = engine
+        self.output_url = output_url
+        self.loop_input = loop_input
+        self.refresh_config: Optional[StableDiffusionConfig] = None
+
+    # this needs to be adapted to api reactions
+    async def feedback(self, stat, interaction):
+        ctx = await self.engine.bot.get_application_context(interaction)
+        await ctx.defer()
+        feedback_queue.submit(
+            self.loop_input.api_url,
+            self.output_url,
+            stat,
+            interaction.user.id,
+        )
+
+    @discord.ui.button(emoji="🔄", style=discord.ButtonStyle.blurple)
+    async def refresh(self, button, interaction):
+        ctx = await self.engine.bot.get_application_context(interaction)
+        await ctx.defer()
+        # while this output's last refresh is still running, another 🔄 joins
+        # that job instead of starting a new one
+        config = self.refresh_config
+        source = self.loop_input.source
+        if config is None or not self.engine.scheduler.is_requested(source, config):
+            config = self.loop_input.config.copy()
+            config.seed = random_seed()
+            self.refresh_config = config
+        await self.engine.refresh_callback(self.loop_input, config)
+
+    @discord.ui.button(label="Lerp It")
+    async def lerp(self, button, interaction):
+        await interaction.response.send_modal(
+            LerpModal(
+                title="Lerp It",
+                engine=self.engine,
+                loop_input=self.loop_input,
+            )
+        )
+
+    @discord.ui.button(emoji="🔥", style=discord.ButtonStyle.red)
+    async def burn(self, button, interaction):
+        await self.feedback("burn", interaction)
+
+    @discord.ui.button(label="🙌", style=discord.ButtonStyle.green)
+    async def praise(self, button, interaction):
+        await self.feedback("praise", interaction)
+        self.stop()
+
+
+class GenerationEngine:
+    """Runs a bot's Eden generations, from request to final upload.
+
+    Cogs keep their own slash commands and checks, build configs from
+    their compiled profile here, and hand them to `start` or
+    `generation_loop`.
+    """
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        profile: CompiledProfile,
+        api_url: str,
+        credentials: SignInCredentials,
+    ) -> None:
+        self.bot = bot
+        self.profile = profile
+        self.api_url = api_url
+        self.scheduler = get_scheduler(api_url, credentials)
+        self.admission = get_admission_queue(api_url)
+        self.journal = JobJournal.for_bot(bot.metadata.name)
+        self.jobs_resumed = False
+
+    def create_config(
+        self,
+        text_input: str,
+        aspect_ratio: str,
+    ) -> StableDiffusionConfig:
+        return self.profile.create.render(
+            [text_input],
+            aspect_ratio,
+            text_input=text_input,
+            seed=random_seed(),
+        )
+
+    def remix_config(self, image_url: str) -> StableDiffusionConfig:
+        return self.profile.remix.render(
+            [],
+            init_image_data=image_url,
+            seed=random_seed(),
+        )
+
+    def real2real_config(self, image_urls: List[str]) -> StableDiffusionConfig:
+        return self.profile.real2real.render(
+            [],
+            interpolation_seeds=[random_seed() for _ in image_urls],
+            interpolation_init_images=image_urls,
+            seed=random_seed(),
+        )
+
+    def lerp_config(
+        self,
+        interpolation_texts: List[str],
+        aspect_ratio: str,
+    ) -> StableDiffusionConfig:
+        return self.profile.lerp.render(
+            interpolation_texts,
+            aspect_ratio,
+            text_input=interpolation_texts[0],
+            interpolation_texts=interpolation_texts,
+            interpolation_seeds=[random_seed() for _ in interpolation_texts],
+            seed=random_seed(),
+        )
+
+    def lerp_it_config(
+        self,
+        config: StableDiffusionConfig,
+        text_input2: str,
+    ) -> StableDiffusionConfig:
+        text_input1 = config.text_input
+        interpolation_texts = [text_input1, text_input2]
+        return self.profile.lerp_it.render(
+            interpolation_texts,
+            text_input=[f"{text_input1} to {text_input2}"],
+            interpolation_texts=interpolation_texts,
+            interpolation_seeds=[config.seed, random_seed()],
+            width=config.width,
+            height=config.height,
+            steps=config.steps,
+        )
+
+    async def start(
+        self,
+        ctx,
+        start_bot_message: str,
+        response: str,
+        config: StableDiffusionConfig,
+        is_video_request: bool = False,
+        prefer_gif: bool = True,
+    ) -> None:
+        source = get_source(ctx)
+        await ctx.respond(response)
+        message = await ctx.channel.send(start_bot_message)
+        generation_loop_input = GenerationLoopInput(
+            api_url=self.api_url,
+            message=message,
+            start_bot_message=start_bot_message,
+            source=source,
+            config=config,
+            is_video_request=is_video_request,
+            prefer_gif=prefer_gif,
+        )
+        await self.generation_loop(generation_loop_input)
+
+    async def generation_loop(
+        self,
+        loop_input: GenerationLoopInput,
+        task_id: Optional[str] = None,
+    ):
+        # this job's status message, whatever happens to loop_input meanwhile
+        message = loop_input.message
+        ticket = None
+        try:
+            if task_id is None:
+                ticket = await self._admit(loop_input, message)
+                task_id = await self.scheduler.request_creation(
+                    loop_input.source, loop_input.config
+                )
+                self.journal.record_started(task_id, dump_job(loop_input))
+            await self._watch(loop_input, message, task_id)
+        except Exception as e:
+            await self.edit_message(
+                message, loop_input.start_bot_message, f"Error: {e}"
+            )
+        finally:
+            if ticket:
+                self.admission.release(ticket)
+        if task_id:
+            self.journal.record_finished(task_id, message.id)
+
+    async def _admit(
+        self,
+        loop_input: GenerationLoopInput,
+        message: discord.Message,
+    ) -> Optional[Ticket]:
+        # joining an identical in-flight request costs Eden nothing
+        source = loop_input.source
+        if self.scheduler.is_requested(source, loop_input.config):
+            return None
+        return await self.admission.acquire(
+            source.author_id,
+            source.guild_id,
+            on_position=functools.partial(
+                self._show_position, message, loop_input.start_bot_message
+            ),
+        )
+
+    async def _show_position(
+        self,
+        message: discord.Message,
+        start_bot_message: str,
+        position: int,
+    ) -> None:
+        # like previews, position updates are dropped when edits run short
+        if not edit_budget.allow_preview(message.channel.id):
+            return
+        await self.edit_message(
+            message,
+            start_bot_message,
+            f"_Waiting in line, position **{position}**_",
+        )
+
+    async def _watch(
+        self,
+        loop_input: GenerationLoopInput,
+        message: discord.Message,
+        task_id: str,
+    ) -> None:
+        current_output_url = None
+        async for result in self.scheduler.watch(task_id, loop_input.polling_policy):
+            if result["status"] == "failed":
+                message_update = self.get_message_update(result)
+                await self.edit_message(
+                    message, loop_input.start_bot_message, message_update
+                )
+                return
+            if result["status"] == "completed":
+                attachment, output_url = await media_cache.get_attachment_update(
+                    result, loop_input.is_video_request
+                )
+                await self._deliver(loop_input, message, attachment, output_url)
+                return
+            # frames are only downloaded once they are new and can be shown
+            if get_output_url(result) == current_output_url:
+                continue
+            if not edit_budget.allow_preview(message.channel.id):
+                # keep current_output_url so the next frame is tried
+                continue
+            attachment, current_output_url = await media_cache.get_attachment_update(
+                result, loop_input.is_video_request
+            )
+            preview = await preview_renderer.render(attachment)
+            await self.edit_message(
+                message,
+                loop_input.start_bot_message,
+                self.get_message_update(result),
+                file_update=preview.to_file() if preview else None,
+            )
+
+    async def _deliver(
+        self,
+        loop_input: GenerationLoopInput,
+        message: discord.Message,
+        attachment: Attachment,
+        output_url: str,
+    ) -> None:
+        attachment = await transcoder.prepare(
+            attachment, loop_input.is_video_request, loop_input.prefer_gif
+        )
+        await edit_budget.acquire_final(message.channel.id)
+        view = CreationActionButtons(
+            engine=self,
+            output_url=output_url,
+            loop_input=loop_input,
+        )
+        if loop_input.parent_message:
+            new_message = await loop_input.parent_message.reply(
+                loop_input.start_bot_message,
+                files=[attachment.to_file()],
+                view=None,
+            )
+        else:
+            new_message = await message.channel.send(
+                loop_input.start_bot_message,
+                files=[attachment.to_file()],
+                view=None,
+            )
+        view.loop_input = dataclasses.replace(loop_input, parent_message=new_message)
+        await message.delete()
+
+    async def resume_jobs(self) -> None:
+        if self.jobs_resumed:
+            return
+        self.jobs_resumed = True
+        jobs = self.journal.unfinished()
+        self.journal.compact()
+        results = await asyncio.gather(
+            *[self.resume_job(task_id, job) for task_id, job in jobs],
+            return_exceptions=True,
+        )
+        for (task_id, job), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logging.error(f"Error resuming job for task {task_id}: {result}")
+                self.journal.record_finished(task_id, job["message_id"])
+
+    async def resume_job(self, task_id: str, job: dict) -> None:
+        message = await fetch_message(self.bot, job["channel_id"], job["message_id"])
+        if not message:
+            self.journal.record_finished(task_id, job["message_id"])
+            return
+        parent_message = await fetch_message(
+            self.bot, job["parent_channel_id"], job["parent_message_id"]
+        )
+        loop_input = GenerationLoopInput(
+            api_url=job["api_url"],
+            start_bot_message=job["start_bot_message"],
+            source=SourceSettings(**job["source"]),
+            config=StableDiffusionConfig(**job["config"]),
+            message=message,
+            is_video_request=job["is_video_request"],
+            prefer_gif=job["prefer_gif"],
+            polling_policy=PollingPolicy(**job["polling_policy"]),
+            parent_message=parent_message,
+        )
+        await self.generation_loop(loop_input, task_id=task_id)
+
+    async def refresh_callback(
+        self,
+        loop_input: GenerationLoopInput,
+        config: StableDiffusionConfig,
+        **changes,
+    ):
+        # each refresh is a job of its own, the view's loop_input stays as is
+        message = await loop_input.parent_message.reply(loop_input.start_bot_message)
+        await self.generation_loop(
+            dataclasses.replace(loop_input, message=message, config=config, **changes),
+        )
+
+    def get_message_update(self, result):
+        status = result["status"]
+        if status == "failed":
+            return "_Server error: Eden task failed_"
+        elif status in "pending":
+            return "_Warming up, please wait._"
+        elif status in "starting":
+            return "_Creation is starting_"
+        elif status == "running":
+            progress = int(100 * result["progress"])
+            return f"_Creation is **{progress}%** complete_"
+        elif status == "complete":
+            return "_Creation is **100%** complete_"
+
+    async def edit_message(
+        self,
+        message: discord.Message,
+        start_bot_message: str,
+        message_update: str,
+        file_update: Optional[discord.File] = None,
+    ) -> discord.Message:
+        fields = {}
+        if message_update is not None:
+            fields["content"] = f"{start_bot_message}\n{message_update}"
+        if file_update:
+            fields["files"] = [file_update]
+            fields["attachments"] = []
+        if fields:
+            await edit_coalescer.edit(message, **fields)
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from typing import Type
+
+import aiohttp
+
+MAX_CONCURRENCY = int(os.getenv("EDEN_MAX_CONCURRENCY", "8"))
+FAILURE_THRESHOLD = int(os.getenv("EDEN_FAILURE_THRESHOLD", "5"))
+RESET_TIMEOUT = float(os.getenv("EDEN_RESET_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("EDEN_MAX_RETRIES", "3"))
+
+
+class EdenOverloaded(Exception):
+    """Eden answered with a status that is worth retrying (429, 5xx)."""
+
+    def __init__(self, status: int, text: str) -> None:
+        super().__init__(f"Eden API returned {status}: {text}")
+        self.status = status
+
+
+RETRYABLE_ERRORS = (
+    aiohttp.ClientConnectionError,
+    asyncio.TimeoutError,
+    EdenOverloaded,
+)
+# errors after which a request can't have been processed, safe to retry even
+# for calls that aren't idempotent (like creating a task)
+SAFE_RETRY_ERRORS = (aiohttp.ClientConnectorError, EdenOverloaded)
+
+
+def is_retryable_status(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+class EdenGovernor:
+    """Bounds and protects all calls to one Eden API.
+
+    At most `max_concurrency` calls are in flight at once; the rest wait
+    for a slot. Overload errors are retried with jittered exponential
+    backoff, and after `failure_threshold` consecutive ones the circuit
+    opens: new calls wait until `reset_timeout` has passed, then a single
+    probe call is let through (half-open) to decide whether to close it
+    again.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        base_delay: float = 0.5,
+        max_delay: float = 8,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._state_changed: Optional[asyncio.Condition] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._probing or self._now() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    async def call(
+        self,
+        fn: Callable[..., Awaitable[Any]],
+        *args,
+        retry_on: Tuple[Type[BaseException], ...] = RETRYABLE_ERRORS,
+        **kwargs,
+    ) -> Any:
+        attempt = 0
+        while True:
+            probe = await self._wait_for_circuit()
+            try:
+                async with self._get_semaphore():
+                    result = await fn(*args, **kwargs)
+            except retry_on as e:
+                await self._record_failure(probe)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                attempt += 1
+                logging.warning(f"Eden call failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            except BaseException:
+                # not an overload, so it says nothing about the circuit
+                if probe:
+                    await self._release_probe()
+                raise
+            else:
+                await self._record_success()
+                return result
+
+    def _backoff(self, attempt: int) -> float:
+        # "full jitter" keeps retries from many loops from arriving together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def _wait_for_circuit(self) -> bool:
+        # returns True if this call is the half-open probe
+        condition = self._get_condition()
+        async with condition:
+            while True:
+                state = self.state
+                if state == "closed":
+                    return False
+                if state == "half-open" and not self._probing:
+                    self._probing = True
+                    return True
+                if state == "open":
+                    remaining = self.reset_timeout - (self._now() - self.opened_at)
+                    try:
+                        await asyncio.wait_for(condition.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await condition.wait()
+
+    async def _record_success(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            if self.opened_at is not None:
+                logging.info("Eden circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+            condition.notify_all()
+
+    async def _record_failure(self, probe: bool) -> None:
+        condition = self._get_condition()
+        async with condition:
+            self.failures += 1
+            if probe or (
+                self.opened_at is None and self.failures >= self.failure_threshold
+            ):
+                logging.warning(f"Eden circuit open after {self.failures} failures")
+                self.opened_at = self._now()
+            if probe:
+                self._probing = False
+            condition.notify_all()
+
+    async def _release_probe(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            self._probing = False
+            condition.notify_all()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # created lazily so they bind to the loop the bot runs on
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._state_changed is None:
+            self._state_changed = asyncio.Condition()
+        return self._state_changed
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+
+_governors: Dict[str, EdenGovernor] = {}
+
+
+def get_governor(api_url: str) -> EdenGovernor:
+    if api_url not in _governors:
+        _governors[api_url] = EdenGovernor()
+    return _governors[api_url]
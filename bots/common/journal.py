@@ -0,0 +1,129 @@
+import dataclasses
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import discord
+
+# Kept outside of bots/ so that writing the journal doesn't trigger superfsmon
+JOURNAL_DIR = Path(os.getenv("JOB_JOURNAL_DIR", "/tmp/marsbots/journal"))
+# Jobs started longer ago than this (in seconds) are not resumed any more
+JOB_TTL = float(os.getenv("JOB_JOURNAL_TTL", str(6 * 60 * 60)))
+
+
+class JobJournal:
+    """Append-only SQLite log of in-flight Eden jobs.
+
+    A job is logged as "started" once its task id is known and "finished"
+    once its result (or error) has been delivered, so jobs interrupted by a
+    restart can be picked up again on the next start. Jobs are keyed by
+    their task and status message, since identical requests share a task.
+    """
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path), isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "job_id TEXT NOT NULL, "
+            "task_id TEXT NOT NULL, "
+            "event TEXT NOT NULL, "
+            "payload TEXT, "
+            "created_at REAL NOT NULL)",
+        )
+
+    @classmethod
+    def for_bot(cls, bot_name: str) -> "JobJournal":
+        return cls(JOURNAL_DIR / f"{bot_name}.sqlite3")
+
+    def _append(
+        self,
+        task_id: str,
+        message_id: int,
+        event: str,
+        payload: Optional[dict] = None,
+    ) -> None:
+        try:
+            self.db.execute(
+                "INSERT INTO job_events (job_id, task_id, event, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    job_id(task_id, message_id),
+                    task_id,
+                    event,
+                    json.dumps(payload, default=str) if payload else None,
+                    time.time(),
+                ),
+            )
+        except sqlite3.Error as e:
+            logging.error(f"Error writing job journal: {e}")
+
+    def record_started(self, task_id: str, job: dict) -> None:
+        self._append(task_id, job["message_id"], "started", job)
+
+    def record_finished(self, task_id: str, message_id: int) -> None:
+        self._append(task_id, message_id, "finished")
+
+    def unfinished(self, ttl: float = JOB_TTL) -> List[Tuple[str, dict]]:
+        rows = self.db.execute(
+            "SELECT task_id, payload FROM job_events WHERE event = 'started' "
+            "AND job_id NOT IN "
+            "(SELECT job_id FROM job_events WHERE event = 'finished') "
+            "AND created_at >= ? ORDER BY id",
+            (time.time() - ttl,),
+        ).fetchall()
+        return [(task_id, json.loads(payload)) for task_id, payload in rows]
+
+    def compact(self, ttl: float = JOB_TTL) -> None:
+        # drops finished jobs, and jobs too old to be resumed
+        self.db.execute(
+            "DELETE FROM job_events WHERE job_id IN "
+            "(SELECT job_id FROM job_events WHERE event = 'finished') "
+            "OR created_at < ?",
+            (time.time() - ttl,),
+        )
+
+
+def job_id(task_id: str, message_id: int) -> str:
+    return f"{task_id}:{message_id}"
+
+
+def dump_job(loop_input) -> dict:
+    parent_message = loop_input.parent_message
+    return {
+        "api_url": loop_input.api_url,
+        "start_bot_message": loop_input.start_bot_message,
+        "source": loop_input.source.dict(),
+        "config": loop_input.config.dict(),
+        "channel_id": loop_input.message.channel.id,
+        "message_id": loop_input.message.id,
+        "parent_channel_id": parent_message.channel.id if parent_message else None,
+        "parent_message_id": parent_message.id if parent_message else None,
+        "is_video_request": loop_input.is_video_request,
+        "prefer_gif": loop_input.prefer_gif,
+        "polling_policy": dataclasses.asdict(loop_input.polling_policy),
+    }
+
+
+async def fetch_message(
+    bot: discord.Client,
+    channel_id: Optional[int],
+    message_id: Optional[int],
+) -> Optional[discord.Message]:
+    if not (channel_id and message_id):
+        return None
+    try:
+        channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+        return await channel.fetch_message(message_id)
+    except discord.HTTPException as e:
+        # NotFound and Forbidden included: the message is gone or unreachable
+        logging.warning(f"Unable to fetch message {message_id}: {e}")
+        return None
@@ -0,0 +1,71 @@
+import re
+from dataclasses import dataclass
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+
+
+@dataclass(frozen=True)
+class LoraProfile:
+    lora_id: str
+    scale: float
+    # only used when one of the prompts mentions the trigger
+    trigger: Optional[str] = None
+
+
+class LoraRouter:
+    """Picks the LoRA to use for a request's prompts.
+
+    All character triggers are compiled into one case-insensitive regex,
+    so each prompt is scanned once however many characters there are.
+    The earliest mention wins, and the longest trigger among mentions
+    starting at the same spot. The LoRA without a trigger, if any, is
+    used when no trigger is mentioned.
+    """
+
+    def __init__(self, loras: Tuple[LoraProfile, ...]) -> None:
+        self.loras = loras
+        defaults = [lora for lora in loras if lora.trigger is None]
+        if len(defaults) > 1:
+            raise ValueError("Only one LoRA can be used without a trigger")
+        self.default = defaults[0] if defaults else None
+        routes = sorted(
+            (lora for lora in loras if lora.trigger is not None),
+            key=lambda lora: len(lora.trigger),
+            reverse=True,
+        )
+        triggers = [lora.trigger.lower() for lora in routes]
+        if len(set(triggers)) != len(triggers):
+            raise ValueError("LoRA triggers must be unique")
+        self._routes = routes
+        # one group per route, so the matching group's index is the route
+        self._pattern = (
+            re.compile(
+                "|".join(f"({re.escape(trigger)})" for trigger in triggers),
+                re.IGNORECASE,
+            )
+            if triggers
+            else None
+        )
+
+    @property
+    def primary(self) -> Optional[LoraProfile]:
+        return self.loras[0] if self.loras else None
+
+    def match(self, texts: Iterable[str]) -> Optional[LoraProfile]:
+        if self._pattern is not None:
+            for text in texts:
+                found = self._pattern.search(text)
+                if found:
+                    return self._routes[found.lastindex - 1]
+        return self.default
+
+
+_routers: Dict[Tuple[LoraProfile, ...], LoraRouter] = {}
+
+
+def get_lora_router(loras: Tuple[LoraProfile, ...]) -> LoraRouter:
+    if loras not in _routers:
+        _routers[loras] = LoraRouter(loras)
+    return _routers[loras]
@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import io
+import mimetypes
+import os
+from collections import OrderedDict
+from pathlib import PurePosixPath
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from urllib.parse import urlparse
+
+import discord
+
+from .http import get_session
+
+# one cache per process, shared by all the bots hosted in it
+MAX_CACHE_BYTES = int(os.getenv("MEDIA_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+
+def get_output_url(result: dict) -> Optional[str]:
+    output = result.get("output")
+    if isinstance(output, list):
+        output = output[-1] if output else None
+    return output or None
+
+
+def get_suffix(output_url: str, content_type: Optional[str] = None) -> str:
+    suffix = PurePosixPath(urlparse(output_url).path).suffix.lower()
+    if suffix or not content_type:
+        return suffix
+    mime_type = content_type.split(";")[0].strip().lower()
+    if not mime_type.startswith(("image/", "video/")):
+        return ""
+    return mimetypes.guess_extension(mime_type) or ""
+
+
+def get_filename(
+    output_url: str,
+    content_type: Optional[str] = None,
+    is_video: bool = False,
+) -> str:
+    # intermediate frames of a video request are images, so each output is
+    # named by its own url or content type, falling back on what it should be
+    suffix = get_suffix(output_url, content_type)
+    return f"output{suffix or ('.mp4' if is_video else '.png')}"
+
+
+class BufferReader(io.RawIOBase):
+    """Read-only file object over a shared buffer.
+
+    Reads are served straight from the memoryview, and closing the reader
+    leaves the buffer intact for the other readers.
+    """
+
+    def __init__(self, buffer: memoryview) -> None:
+        self.buffer = buffer
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        chunk = self.buffer[self.position : self.position + len(target)]
+        target[: len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.buffer)
+        self.position = max(0, offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+
+class Attachment:
+    """A downloaded output that can be uploaded to any number of messages.
+
+    discord.File is consumed (and closed) by each upload, so `to_file`
+    returns a new one per destination, all reading the same bytes.
+    """
+
+    def __init__(self, data: bytes, filename: str, sha: Optional[str] = None) -> None:
+        self.data = memoryview(data)
+        self.filename = filename
+        self.sha = sha
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def to_file(self) -> discord.File:
+        return discord.File(BufferReader(self.data), filename=self.filename)
+
+
+class MediaCache:
+    """Content-addressed cache of downloaded Eden outputs.
+
+    Bytes are stored once per sha256 and looked up by output URL, so a
+    preview frame, the final upload and a refresh of the same output are
+    downloaded once. Entries are evicted least recently used first once
+    the cache holds more than `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = MAX_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._blobs: "OrderedDict[str, bytes]" = OrderedDict()
+        self._shas: Dict[str, str] = {}
+        self._content_types: Dict[str, str] = {}
+        self._downloads: Dict[str, asyncio.Future] = {}
+
+    def get(self, output_url: str) -> Optional[bytes]:
+        sha = self._shas.get(output_url)
+        if sha is None or sha not in self._blobs:
+            return None
+        self._blobs.move_to_end(sha)
+        return self._blobs[sha]
+
+    def content_type(self, output_url: str) -> Optional[str]:
+        return self._content_types.get(output_url)
+
+    def put(
+        self,
+        output_url: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+    ) -> str:
+        sha = hashlib.sha256(data).hexdigest()
+        self._shas[output_url] = sha
+        if content_type:
+            self._content_types[output_url] = content_type
+        if sha not in self._blobs:
+            self._blobs[sha] = data
+            self.size += len(data)
+            self._evict()
+        self._blobs.move_to_end(sha)
+        return sha
+
+    def _evict(self) -> None:
+        while self.size > self.max_bytes and len(self._blobs) > 1:
+            sha, data = self._blobs.popitem(last=False)
+            self.size -= len(data)
+            self._shas = {url: s for url, s in self._shas.items() if s != sha}
+            self._content_types = {
+                url: content_type
+                for url, content_type in self._content_types.items()
+                if url in self._shas
+            }
+
+    async def fetch(self, output_url: str) -> bytes:
+        data = self.get(output_url)
+        if data is not None:
+            self.hits += 1
+            return data
+        # several loops can see the same new output at once; download it once
+        download = self._downloads.get(output_url)
+        if download is None:
+            self.misses += 1
+            download = asyncio.ensure_future(self._download(output_url))
+            self._downloads[output_url] = download
+            download.add_done_callback(
+                lambda _: self._downloads.pop(output_url, None),
+            )
+        else:
+            self.hits += 1
+        return await asyncio.shield(download)
+
+    async def _download(self, output_url: str) -> bytes:
+        session = get_session()
+        async with session.get(output_url) as response:
+            if response.status != 200:
+                raise Exception(f"Unable to download {output_url}: {response.status}")
+            data = await response.read()
+            content_type = response.headers.get("Content-Type")
+        self.put(output_url, data, content_type)
+        return data
+
+    async def get_attachment_update(
+        self,
+        result: dict,
+        is_video_request: bool = False,
+    ) -> Tuple[Optional[Attachment], Optional[str]]:
+        # unlike marsbots_eden's get_file_update this takes no prefer_gif: the
+        # attachment is always named after the bytes Eden sent, and GIFs are
+        # made from the final video by the transcoder
+        output_url = get_output_url(result)
+        if output_url is None:
+            return None, None
+        data = await self.fetch(output_url)
+        filename = get_filename(
+            output_url,
+            self.content_type(output_url),
+            is_video=is_video_request and result["status"] == "completed",
+        )
+        sha = self._shas.get(output_url)
+        return Attachment(data, filename, sha=sha), output_url
+
+
+media_cache = MediaCache()
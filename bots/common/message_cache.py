@@ -0,0 +1,109 @@
+import logging
+from collections import OrderedDict
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import discord
+
+
+class ChannelMessageCache:
+    """Recent messages per channel, fed by gateway events.
+
+    Reply chains and "last N messages" are served from the cache. On a miss
+    the page of history ending with the missing message is fetched in one
+    request, so the rest of the chain is usually a cache hit again.
+    """
+
+    def __init__(self, max_per_channel: int = 200, backfill_limit: int = 50) -> None:
+        self.max_per_channel = max_per_channel
+        self.backfill_limit = backfill_limit
+        self.hits = 0
+        self.misses = 0
+        self._channels: Dict[int, "OrderedDict[int, discord.Message]"] = {}
+        # id of the first message seen live per channel; every message after it
+        # has been delivered to the cache
+        self._live_since: Dict[int, int] = {}
+
+    def add(self, message: discord.Message, live: bool = False) -> None:
+        channel_id = message.channel.id
+        messages = self._channels.setdefault(channel_id, OrderedDict())
+        messages[message.id] = message
+        messages.move_to_end(message.id)
+        while len(messages) > self.max_per_channel:
+            messages.popitem(last=False)
+        if live:
+            self._live_since.setdefault(channel_id, message.id)
+
+    def remove(self, channel_id: int, message_id: int) -> None:
+        self._channels.get(channel_id, {}).pop(message_id, None)
+
+    def get(self, channel_id: int, message_id: int) -> Optional[discord.Message]:
+        message = self._channels.get(channel_id, {}).get(message_id)
+        if message is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return message
+
+    async def get_last_messages(
+        self,
+        channel: discord.abc.Messageable,
+        limit: int,
+    ) -> List[discord.Message]:
+        messages = self._channels.get(channel.id, {})
+        live_since = self._live_since.get(channel.id)
+        if live_since is not None:
+            live_ids = sorted(id for id in messages if id >= live_since)
+            if len(live_ids) >= limit:
+                self.hits += 1
+                return [messages[id] for id in live_ids[-limit:]]
+        self.misses += 1
+        history = [message async for message in channel.history(limit=limit)]
+        for message in history:
+            self.add(message)
+        return history[::-1]
+
+    async def get_reply_chain(
+        self,
+        message: discord.Message,
+        depth: int = 10,
+    ) -> List[discord.Message]:
+        chain = []
+        current = message
+        while current.reference and current.reference.message_id and len(chain) < depth:
+            parent = await self._get_parent(current)
+            if parent is None:
+                break
+            chain.append(parent)
+            current = parent
+        return chain[::-1]
+
+    async def _get_parent(self, message: discord.Message) -> Optional[discord.Message]:
+        reference = message.reference
+        channel_id = reference.channel_id or message.channel.id
+        parent = self.get(channel_id, reference.message_id)
+        if parent is None and isinstance(reference.resolved, discord.Message):
+            parent = reference.resolved
+            self.add(parent)
+        if parent is not None:
+            return parent
+        if channel_id != message.channel.id:
+            return None
+        await self._backfill(message.channel, reference.message_id)
+        return self._channels.get(channel_id, {}).get(reference.message_id)
+
+    async def _backfill(
+        self,
+        channel: discord.abc.Messageable,
+        message_id: int,
+    ) -> None:
+        # `before` is exclusive, so the page starts with the message itself
+        before = discord.Object(id=message_id + 1)
+        try:
+            async for message in channel.history(
+                limit=self.backfill_limit, before=before
+            ):
+                self.add(message)
+        except discord.HTTPException as e:
+            logging.warning(f"Unable to backfill messages in {channel.id}: {e}")
@@ -0,0 +1,54 @@
+import asyncio
+from typing import Dict
+from typing import Tuple
+
+import discord
+
+
+class MessageEditCoalescer:
+    """Applies edits to a message one at a time, newest wins.
+
+    While an edit is in flight, only the latest requested edit for that
+    message is kept; older pending ones are dropped (their awaiters get
+    False) since they would be overwritten immediately anyway.
+    """
+
+    def __init__(self) -> None:
+        self.dropped = 0
+        self._pending: Dict[int, Tuple[dict, asyncio.Future]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+
+    async def edit(self, message: discord.Message, **fields) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        previous = self._pending.get(message.id)
+        if previous is not None:
+            self._drop(*previous)
+        self._pending[message.id] = (fields, future)
+        if message.id not in self._workers:
+            self._workers[message.id] = asyncio.create_task(self._drain(message))
+        return await future
+
+    def _drop(self, fields: dict, future: asyncio.Future) -> None:
+        self.dropped += 1
+        for file in fields.get("files", []):
+            file.close()
+        if not future.done():
+            future.set_result(False)
+
+    async def _drain(self, message: discord.Message) -> None:
+        try:
+            while message.id in self._pending:
+                fields, future = self._pending.pop(message.id)
+                try:
+                    await message.edit(**fields)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(True)
+        finally:
+            del self._workers[message.id]
+
+
+edit_coalescer = MessageEditCoalescer()
@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from typing import Optional
+
+QUEUED_STATUSES = ("pending", "starting")
+
+
+@dataclass(frozen=True)
+class PollingPolicy:
+    """How often to poll a task, depending on its status and progress rate."""
+
+    interval: float = 2
+    min_interval: float = 1
+    # keeps a finished task from waiting long for its next poll
+    max_interval: float = 5
+    # a running task is polled around its expected completion anyway, so it
+    # can wait longer between progress steps
+    max_running_interval: float = 20
+    queued_backoff: float = 1.5
+    progress_step: float = 0.05
+    rate_smoothing: float = 0.5
+
+    def tracker(self) -> "PollingTracker":
+        return PollingTracker(self)
+
+
+class PollingTracker:
+    def __init__(self, policy: PollingPolicy) -> None:
+        self.policy = policy
+        self.queued_interval = policy.interval
+        self.last_progress: Optional[float] = None
+        self.last_progress_time: Optional[float] = None
+        self.rate: Optional[float] = None
+
+    def next_interval(self, result: dict, now: float) -> float:
+        policy = self.policy
+        status = result.get("status")
+        if status in QUEUED_STATUSES:
+            # nothing to show while queued, back off until the task starts
+            self.queued_interval = min(
+                self.queued_interval * policy.queued_backoff,
+                policy.max_interval,
+            )
+            return self.queued_interval
+        # the task has started, so the queued backoff starts over
+        self.queued_interval = policy.interval
+        if status != "running":
+            return policy.interval
+
+        progress = result.get("progress") or 0
+        self.observe_progress(progress, now)
+        if not self.rate:
+            return policy.interval
+
+        # poll when the next progress step (or completion) is expected
+        until_step = policy.progress_step / self.rate
+        until_done = (1 - progress) / self.rate
+        interval = min(until_step, until_done)
+        return max(policy.min_interval, min(interval, policy.max_running_interval))
+
+    def observe_progress(self, progress: float, now: float) -> None:
+        if self.last_progress is None:
+            self.last_progress, self.last_progress_time = progress, now
+            return
+        if progress <= self.last_progress or now <= self.last_progress_time:
+            return
+        observed = (progress - self.last_progress) / (now - self.last_progress_time)
+        if self.rate is None:
+            self.rate = observed
+        else:
+            smoothing = self.policy.rate_smoothing
+            self.rate = smoothing * observed + (1 - smoothing) * self.rate
+        self.last_progress, self.last_progress_time = progress, now
@@ -0,0 +1,86 @@
+import asyncio
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+from typing import Optional
+
+from .cache import TTLCache
+from .media import Attachment
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def downscale(data: memoryview, size: int, quality: int) -> Optional[bytes]:
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        output = io.BytesIO()
+        image.save(output, format="WEBP", quality=quality)
+    preview = output.getvalue()
+    return preview if len(preview) < len(data) else None
+
+
+class PreviewRenderer:
+    """Downscales intermediate frames to small WebP previews off the event loop.
+
+    Only progress previews go through here; final outputs are uploaded
+    as they are. Without Pillow, or for videos, previews are left as is.
+    """
+
+    def __init__(
+        self,
+        size: int = 512,
+        quality: int = 80,
+        max_workers: int = 2,
+        max_cached: int = 256,
+    ) -> None:
+        self.size = size
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="preview",
+        )
+        self.saved_bytes = 0
+        self._previews = TTLCache(max_size=max_cached)
+
+    def can_render(self, attachment: Attachment) -> bool:
+        suffix = PurePosixPath(attachment.filename).suffix.lower()
+        return Image is not None and suffix in IMAGE_SUFFIXES
+
+    async def render(self, attachment: Optional[Attachment]) -> Optional[Attachment]:
+        if attachment is None or not self.can_render(attachment):
+            return attachment
+        preview = self._previews.get(attachment.sha) if attachment.sha else None
+        if preview is None:
+            preview = await self._render(attachment)
+            if attachment.sha:
+                self._previews.set(attachment.sha, preview)
+        return preview
+
+    async def _render(self, attachment: Attachment) -> Attachment:
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(
+                self.executor,
+                downscale,
+                attachment.data,
+                self.size,
+                self.quality,
+            )
+        except Exception as e:
+            logging.error(f"Error rendering preview: {e}")
+            return attachment
+        if data is None:
+            return attachment
+        self.saved_bytes += len(attachment) - len(data)
+        return Attachment(data, "preview.webp")
+
+
+preview_renderer = PreviewRenderer()
@@ -0,0 +1,146 @@
+import dataclasses
+import json
+from pathlib import Path
+from typing import Any
+from typing import Dict
+
+from marsbots_eden.models import StableDiffusionConfig
+
+from .generation import CommandProfile
+from .generation import COMMANDS
+from .generation import CompiledProfile
+from .generation import GenerationProfile
+from .generation import IMAGE_DIMENSIONS
+from .generation import Size
+from .generation import VIDEO_DIMENSIONS
+from .lora_routing import LoraProfile
+
+NAMED_DIMENSIONS = {"image": IMAGE_DIMENSIONS, "video": VIDEO_DIMENSIONS}
+PROFILE_KEYS = {"name", "loras", "commands"}
+LORA_KEYS = {"lora_id", "scale", "trigger"}
+COMMAND_KEYS = {
+    "generator_name",
+    "steps",
+    "size",
+    "dimensions",
+    "params",
+    "lora_on_trigger",
+}
+
+
+class ProfileError(ValueError):
+    pass
+
+
+def load_profile(path: Path) -> CompiledProfile:
+    """Loads a bot's profile.json and compiles it into config templates.
+
+    The file only lists what differs from the default commands in
+    bots.common.generation; params are merged into the defaults.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return parse_profile(data).compile()
+    except (OSError, ValueError, TypeError) as e:
+        raise ProfileError(f"Invalid generation profile {path}: {e}") from e
+
+
+def parse_profile(data: Dict[str, Any]) -> GenerationProfile:
+    check_keys("profile", data, PROFILE_KEYS)
+    if not isinstance(data.get("name"), str):
+        raise ProfileError("profile needs a name")
+    commands = data.get("commands", {})
+    check_keys("commands", commands, set(COMMANDS))
+    loras = data.get("loras", [])
+    if not isinstance(loras, list):
+        raise ProfileError("loras must be a list")
+    profile = GenerationProfile(
+        name=data["name"],
+        loras=tuple(parse_lora(lora) for lora in loras),
+    )
+    overrides = {
+        command: parse_command(command, getattr(profile, command), fields)
+        for command, fields in commands.items()
+    }
+    return dataclasses.replace(profile, **overrides)
+
+
+def parse_lora(data: Dict[str, Any]) -> LoraProfile:
+    check_keys("lora", data, LORA_KEYS)
+    if not isinstance(data.get("lora_id"), str):
+        raise ProfileError("lora needs a lora_id")
+    if not isinstance(data.get("scale"), (int, float)):
+        raise ProfileError("lora needs a numeric scale")
+    trigger = data.get("trigger")
+    if trigger is not None and not (isinstance(trigger, str) and trigger):
+        raise ProfileError("lora trigger must be a non-empty string")
+    return LoraProfile(
+        data["lora_id"],
+        float(data["scale"]),
+        trigger=trigger,
+    )
+
+
+def parse_command(
+    name: str,
+    default: CommandProfile,
+    data: Dict[str, Any],
+) -> CommandProfile:
+    check_keys(name, data, COMMAND_KEYS)
+    fields = {}
+    if "generator_name" in data:
+        fields["generator_name"] = check_type(name, data, "generator_name", str)
+    if "steps" in data:
+        fields["steps"] = check_type(name, data, "steps", int)
+    if "size" in data:
+        fields["size"] = parse_size(name, data["size"])
+    if "dimensions" in data:
+        fields["dimensions"] = parse_dimensions(name, data["dimensions"])
+    if "lora_on_trigger" in data:
+        fields["lora_on_trigger"] = check_type(name, data, "lora_on_trigger", bool)
+    command = dataclasses.replace(default, **fields)
+    params = check_type(name, data, "params", dict) if "params" in data else {}
+    unknown = set(params) - set(StableDiffusionConfig.__fields__)
+    if unknown:
+        raise ProfileError(f"{name} has unknown params: {', '.join(sorted(unknown))}")
+    return command.with_params(**params)
+
+
+def parse_size(name: str, size: Any) -> Size:
+    if (
+        not isinstance(size, list)
+        or len(size) != 2
+        or not all(isinstance(n, int) and n > 0 for n in size)
+    ):
+        raise ProfileError(f"{name} sizes must be [width, height], got {size!r}")
+    return tuple(size)
+
+
+def parse_dimensions(name: str, dimensions: Any) -> Dict[str, Size]:
+    if isinstance(dimensions, str):
+        if dimensions not in NAMED_DIMENSIONS:
+            raise ProfileError(f"{name} has unknown dimensions {dimensions!r}")
+        return NAMED_DIMENSIONS[dimensions]
+    if not isinstance(dimensions, dict):
+        raise ProfileError(f"{name} dimensions must be a name or a mapping")
+    return {
+        aspect_ratio: parse_size(name, size)
+        for aspect_ratio, size in dimensions.items()
+    }
+
+
+def check_keys(name: str, data: Any, allowed: set) -> None:
+    if not isinstance(data, dict):
+        raise ProfileError(f"{name} must be an object")
+    unknown = set(data) - allowed
+    if unknown:
+        raise ProfileError(f"{name} has unknown keys: {', '.join(sorted(unknown))}")
+
+
+def check_type(name: str, data: Dict[str, Any], key: str, expected: type) -> Any:
+    value = data[key]
+    # bool is an int, but a step count of True is a mistake
+    if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+        raise ProfileError(f"{name}.{key} must be of type {expected.__name__}")
+    return value
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Dict
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, period: float) -> None:
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, reserve: float = 0) -> bool:
+        self._refill()
+        if self.tokens - 1 < reserve:
+            return False
+        self.tokens -= 1
+        return True
+
+    def delay(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class EditBudget:
+    """Per-channel token buckets sized to Discord's edit rate limit.
+
+    Preview edits only go out while more than `final_reserve` tokens are
+    left, so the final result of a creation never waits behind previews.
+    Skipped previews are counted per channel.
+    """
+
+    def __init__(
+        self,
+        capacity: float = 5,
+        period: float = 5,
+        final_reserve: float = 1,
+    ) -> None:
+        self.capacity = capacity
+        self.period = period
+        self.final_reserve = final_reserve
+        self.skipped_previews: Counter = Counter()
+        self._buckets: Dict[int, TokenBucket] = {}
+
+    def _bucket(self, channel_id: int) -> TokenBucket:
+        if channel_id not in self._buckets:
+            self._buckets[channel_id] = TokenBucket(self.capacity, self.period)
+        return self._buckets[channel_id]
+
+    def allow_preview(self, channel_id: int) -> bool:
+        if self._bucket(channel_id).try_take(reserve=self.final_reserve):
+            return True
+        self.skipped_previews[channel_id] += 1
+        return False
+
+    async def acquire_final(self, channel_id: int) -> None:
+        bucket = self._bucket(channel_id)
+        while not bucket.try_take():
+            await asyncio.sleep(bucket.delay())
+
+
+edit_budget = EditBudget()
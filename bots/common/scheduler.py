@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import AsyncIterator
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from marsbots_eden.models import SignInCredentials
+from marsbots_eden.models import SourceSettings
+from marsbots_eden.models import StableDiffusionConfig
+
+from .eden import create_task
+from .eden import fetch_tasks
+from .governor import get_governor
+from .governor import SAFE_RETRY_ERRORS
+from .polling import PollingPolicy
+from .polling import PollingTracker
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class TaskNotFound(Exception):
+    def __init__(self, task_id: str) -> None:
+        super().__init__(f"Eden task {task_id} not found")
+        self.task_id = task_id
+
+
+def request_key(source: SourceSettings, config: StableDiffusionConfig) -> str:
+    request = {"source": source.dict(), "config": config.dict()}
+    canonical = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class EdenTaskScheduler:
+    """Polls every in-flight Eden task in batches, one tick per interval.
+
+    Generation loops subscribe to a task id with `watch` and receive each
+    status change, instead of polling the API on their own. Each task is
+    only included in a tick once its polling policy says it is due.
+
+    Identical creation requests (same config and source) made while the
+    first one is still in flight are attached to the existing task.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        credentials: SignInCredentials,
+        interval: float = 1,
+        batch_size: int = 50,
+        max_missing_polls: int = 10,
+        max_backoff: float = 30,
+    ) -> None:
+        self.api_url = api_url
+        self.credentials = credentials
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_missing_polls = max_missing_polls
+        self.max_backoff = max_backoff
+        self.poll_failures = 0
+        self.governor = get_governor(api_url)
+        self._watchers: Dict[str, List[asyncio.Queue]] = {}
+        self._results: Dict[str, dict] = {}
+        self._trackers: Dict[str, PollingTracker] = {}
+        self._due: Dict[str, float] = {}
+        self._missing: Dict[str, int] = {}
+        self._runner: Optional[asyncio.Task] = None
+        self._requests: Dict[str, asyncio.Future] = {}
+        self._request_keys: Dict[str, str] = {}
+        self.deduplicated = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._watchers)
+
+    def is_requested(
+        self,
+        source: SourceSettings,
+        config: StableDiffusionConfig,
+    ) -> bool:
+        return request_key(source, config) in self._requests
+
+    async def request_creation(
+        self,
+        source: SourceSettings,
+        config: StableDiffusionConfig,
+    ) -> str:
+        key = request_key(source, config)
+        if key in self._requests:
+            self.deduplicated += 1
+            return await asyncio.shield(self._requests[key])
+        future = asyncio.get_running_loop().create_future()
+        self._requests[key] = future
+        try:
+            task_id = await self.governor.call(
+                create_task,
+                self.api_url,
+                self.credentials,
+                source,
+                config,
+                retry_on=SAFE_RETRY_ERRORS,
+            )
+        except Exception as e:
+            del self._requests[key]
+            future.set_exception(e)
+            # mark retrieved, in case nobody else attached to this request
+            future.exception()
+            raise
+        self._request_keys[task_id] = key
+        future.set_result(task_id)
+        return task_id
+
+    async def watch(
+        self,
+        task_id: str,
+        policy: Optional[PollingPolicy] = None,
+    ) -> AsyncIterator[dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._watchers.setdefault(task_id, []).append(queue)
+        if task_id not in self._trackers:
+            policy = policy or PollingPolicy()
+            self._trackers[task_id] = policy.tracker()
+            self._due[task_id] = self._now() + policy.min_interval
+        if task_id in self._results:
+            queue.put_nowait(self._results[task_id])
+        self._ensure_running()
+        try:
+            while True:
+                result = await queue.get()
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+                if result["status"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            self._unwatch(task_id, queue)
+
+    def _unwatch(self, task_id: str, queue: asyncio.Queue) -> None:
+        queues = self._watchers.get(task_id, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self._watchers.pop(task_id, None)
+            self._results.pop(task_id, None)
+            self._trackers.pop(task_id, None)
+            self._due.pop(task_id, None)
+            self._missing.pop(task_id, None)
+            key = self._request_keys.pop(task_id, None)
+            if key is not None:
+                self._requests.pop(key, None)
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _ensure_running(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self._watchers:
+            await asyncio.sleep(self.interval)
+            await self.tick()
+
+    async def tick(self) -> None:
+        now = self._now()
+        task_ids = [
+            task_id for task_id, due in self._due.items() if due <= now
+        ]
+        for task_id in task_ids:
+            # until a result arrives, retry at the policy's base interval
+            self._due[task_id] = now + self._trackers[task_id].policy.interval
+        batches = [
+            task_ids[i : i + self.batch_size]
+            for i in range(0, len(task_ids), self.batch_size)
+        ]
+        await asyncio.gather(*[self._poll_batch(batch) for batch in batches])
+
+    async def _poll_batch(self, task_ids: List[str]) -> None:
+        try:
+            tasks = await self.governor.call(
+                fetch_tasks, self.api_url, self.credentials, task_ids
+            )
+        except Exception as e:
+            # the tasks may well still be running: keep them scheduled and try
+            # again later, only a "failed" status from Eden fails a job
+            self.poll_failures += 1
+            backoff = min(self.max_backoff, self.interval * 2**self.poll_failures)
+            logging.error(
+                f"Error polling {len(task_ids)} Eden tasks, retrying in "
+                f"{backoff:.0f}s: {e}",
+            )
+            due = self._now() + backoff
+            for task_id in task_ids:
+                if task_id in self._due:
+                    self._due[task_id] = max(self._due[task_id], due)
+            return
+        self.poll_failures = 0
+        for task in tasks:
+            task_id = task.get("taskId")
+            if task_id not in self._watchers:
+                continue
+            now = self._now()
+            self._due[task_id] = now + self._trackers[task_id].next_interval(task, now)
+            if task != self._results.get(task_id):
+                self._results[task_id] = task
+                self._publish(task_id, task)
+        self._count_missing(task_ids, tasks)
+
+    def _count_missing(self, task_ids: List[str], tasks: List[dict]) -> None:
+        # a task Eden keeps leaving out of its answers (e.g. a resumed job whose
+        # task has expired) is given up on instead of being polled forever
+        returned = {task.get("taskId") for task in tasks}
+        for task_id in task_ids:
+            if task_id in returned or task_id not in self._watchers:
+                self._missing.pop(task_id, None)
+                continue
+            self._missing[task_id] = self._missing.get(task_id, 0) + 1
+            if self._missing[task_id] >= self.max_missing_polls:
+                logging.warning(f"Eden task {task_id} not found, giving up")
+                self._publish(task_id, TaskNotFound(task_id))
+
+    def _publish(self, task_id: str, item) -> None:
+        for queue in self._watchers.get(task_id, []):
+            queue.put_nowait(item)
+
+
+_schedulers: Dict[Tuple[str, str], EdenTaskScheduler] = {}
+
+
+def get_scheduler(api_url: str, credentials: SignInCredentials) -> EdenTaskScheduler:
+    key = (api_url, credentials.apiKey)
+    if key not in _schedulers:
+        _schedulers[key] = EdenTaskScheduler(api_url, credentials)
+    return _schedulers[key]
@@ -0,0 +1,151 @@
+import asyncio
+import dataclasses
+import time
+from typing import AsyncIterator
+from typing import Awaitable
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import discord
+import openai
+from marsbots.language_models import OpenAIGPT3LanguageModel
+
+from .message_edits import edit_coalescer
+from .rate_limit import edit_budget
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+
+async def stream_completion(
+    language_model: OpenAIGPT3LanguageModel,
+    prompt: str,
+    max_tokens: int,
+    stop: Optional[List[str]] = None,
+) -> AsyncIterator[str]:
+    # The OpenAI client is blocking, so the stream is read on a worker thread
+    # and handed over to the event loop chunk by chunk.
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    def produce() -> None:
+        try:
+            # engine and every sampling parameter, as completion_handler uses
+            response = openai.Completion.create(
+                **dataclasses.asdict(language_model.settings),
+                prompt=prompt,
+                max_tokens=max_tokens,
+                stop=stop,
+                stream=True,
+            )
+            for chunk in response:
+                loop.call_soon_threadsafe(queue.put_nowait, chunk["choices"][0]["text"])
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    producer = loop.run_in_executor(None, produce)
+    while True:
+        item = await queue.get()
+        if item is done:
+            break
+        if isinstance(item, Exception):
+            raise item
+        yield item
+    await producer
+
+
+class StreamingReply:
+    """Replies to a message with text that is still being generated.
+
+    The reply is posted once there is visible text and then edited at
+    most every `edit_interval` seconds, within the channel's edit budget.
+    The last edit always carries the complete text, formatted by
+    `finalize` exactly like a non-streamed reply would be.
+
+    With `is_safe`, the text added since the last check is checked at each
+    of those edits, and the complete text once at the end, before any of
+    it is shown. Once a check fails the reply stops updating and ends with
+    the text `fallback` returns instead, e.g. a non-streamed completion.
+    """
+
+    def __init__(
+        self,
+        message: discord.Message,
+        finalize: Callable[[str], str] = str.strip,
+        edit_interval: float = 1,
+        is_safe: Optional[Callable[[str], Awaitable[bool]]] = None,
+        fallback: Optional[Callable[[], Awaitable[str]]] = None,
+    ) -> None:
+        self.message = message
+        self.finalize = finalize
+        self.edit_interval = edit_interval
+        self.is_safe = is_safe
+        self.fallback = fallback
+        self.blocked = False
+        self.reply: Optional[discord.Message] = None
+        self._shown = ""
+        self._checked = ""
+        self._last_edit = 0.0
+
+    def _format(self, text: str) -> str:
+        return self.finalize(text)[:DISCORD_MESSAGE_LIMIT]
+
+    async def stream(self, chunks: AsyncIterator[str]) -> Tuple[str, discord.Message]:
+        text = ""
+        # the first post waits for an edit boundary too
+        self._last_edit = time.monotonic()
+        async for chunk in chunks:
+            text += chunk
+            if self.blocked or time.monotonic() - self._last_edit < self.edit_interval:
+                continue
+            visible = self._format(text)
+            if not visible or visible == self._shown:
+                continue
+            channel_id = self.message.channel.id
+            if self.reply is not None and not edit_budget.allow_preview(channel_id):
+                continue
+            if await self._check(text):
+                await self._update(visible)
+        final = self._format(text)
+        if not self.blocked and self.is_safe is not None:
+            self.blocked = not await self.is_safe(text)
+        if self.blocked:
+            final = self._format(await self.fallback()) if self.fallback else ""
+        await self.finish(final)
+        return final, self.reply
+
+    async def _check(self, text: str) -> bool:
+        # only what was added since the last check goes to the filter
+        if self.is_safe is not None:
+            new_text = text[len(self._checked) :]
+            self.blocked = not await self.is_safe(new_text)
+            self._checked = text
+        return not self.blocked
+
+    async def _update(self, visible: str) -> None:
+        if self.reply is None:
+            self.reply = await self.message.reply(visible)
+        else:
+            await edit_coalescer.edit(self.reply, content=visible)
+        self._show(visible)
+
+    async def finish(self, final: str) -> None:
+        if not final:
+            # nothing to say; don't leave a partial reply behind
+            if self.reply is not None:
+                await self.reply.delete()
+            return
+        if self.reply is None:
+            self.reply = await self.message.reply(final)
+        elif final != self._shown:
+            await edit_budget.acquire_final(self.message.channel.id)
+            await edit_coalescer.edit(self.reply, content=final)
+        self._show(final)
+
+    def _show(self, text: str) -> None:
+        self._shown = text
+        self._last_edit = time.monotonic()
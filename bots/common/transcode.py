@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import multiprocessing
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .cache import TTLCache
+from .media import Attachment
+
+DISCORD_UPLOAD_LIMIT = 8 * 1024 * 1024
+GIF_FPS = 15
+SCALES = (1.0, 0.75, 0.5, 0.35)
+
+TranscodeKey = Tuple[str, str, int]
+
+
+def sniff_format(data: memoryview) -> Optional[str]:
+    # outputs are often named output.mp4 whatever they hold, so go by the bytes
+    header = bytes(data[:12])
+    if header[4:8] == b"ftyp":
+        return "mp4"
+    if header.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    return None
+
+
+def probe_duration(path: Path) -> float:
+    output = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration",
+            "-of",
+            "default=noprint_wrappers=1:nokey=1",
+            str(path),
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    try:
+        return max(float(output.strip()), 0.1)
+    except ValueError:
+        return 1.0
+
+
+def ffmpeg_args(
+    source: Path,
+    target: Path,
+    output_format: str,
+    scale: float,
+    bitrate: int,
+) -> List[str]:
+    resize = f"scale=trunc(iw*{scale}/2)*2:-2:flags=lanczos"
+    args = ["ffmpeg", "-y", "-v", "error", "-i", str(source), "-an"]
+    if output_format == "gif":
+        palette = "split[a][b];[a]palettegen[p];[b][p]paletteuse"
+        filters = f"fps={GIF_FPS},{resize},{palette}"
+        return args + ["-vf", filters, "-loop", "0", str(target)]
+    if output_format == "webm":
+        codec = ["-c:v", "libvpx-vp9"]
+    else:
+        codec = ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-movflags", "+faststart"]
+    rate = ["-b:v", str(bitrate), "-maxrate", str(bitrate)]
+    buffer = ["-bufsize", str(2 * bitrate)]
+    return args + ["-vf", resize] + codec + rate + buffer + [str(target)]
+
+
+def transcode(
+    data: bytes,
+    input_suffix: str,
+    output_format: str,
+    max_bytes: int,
+) -> bytes:
+    # Runs in a worker process. Tries progressively smaller frames until the
+    # output fits, and returns the smallest attempt if none does.
+    with tempfile.TemporaryDirectory() as directory:
+        source = Path(directory) / f"input{input_suffix}"
+        source.write_bytes(data)
+        target = Path(directory) / f"output.{output_format}"
+        # leave some headroom for the container overhead
+        bitrate = int(max_bytes * 8 * 0.9 / probe_duration(source))
+        output = b""
+        for scale in SCALES:
+            args = ffmpeg_args(source, target, output_format, scale, bitrate)
+            subprocess.run(args, capture_output=True, check=True)
+            output = target.read_bytes()
+            if len(output) <= max_bytes:
+                break
+        return output
+
+
+class Transcoder:
+    """Converts video outputs into a format and size Discord accepts.
+
+    ffmpeg runs in a process pool so the event loop is never blocked, and
+    results are memoized per output sha, format and size limit.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DISCORD_UPLOAD_LIMIT,
+        max_workers: int = 2,
+        max_cached: int = 64,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._results = TTLCache(max_size=max_cached)
+        self._running: Dict[TranscodeKey, asyncio.Future] = {}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawned, not forked, so workers don't inherit the bot's event
+            # loop, sockets and threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def output_format(self, input_format: Optional[str], prefer_gif: bool) -> str:
+        if prefer_gif:
+            return "gif"
+        return input_format if input_format in ("mp4", "webm") else "mp4"
+
+    async def prepare(
+        self,
+        attachment: Optional[Attachment],
+        is_video_request: bool,
+        prefer_gif: bool,
+    ) -> Optional[Attachment]:
+        if attachment is None or not is_video_request:
+            return attachment
+        input_format = sniff_format(attachment.data)
+        output_format = self.output_format(input_format, prefer_gif)
+        filename = f"output.{output_format}"
+        if input_format == output_format and len(attachment) <= self.max_bytes:
+            if filename == attachment.filename:
+                return attachment
+            return Attachment(attachment.data, filename, sha=attachment.sha)
+        key = (attachment.sha, output_format, self.max_bytes)
+        data = self._results.get(key) if attachment.sha else None
+        if data is None:
+            try:
+                data = await self._transcode(
+                    key, attachment, input_format, output_format
+                )
+            except Exception as e:
+                logging.error(f"Error transcoding {attachment.filename}: {e}")
+                return attachment
+        return Attachment(data, filename, sha=attachment.sha)
+
+    async def _transcode(
+        self,
+        key: TranscodeKey,
+        attachment: Attachment,
+        input_format: Optional[str],
+        output_format: str,
+    ) -> bytes:
+        running = self._running.get(key)
+        if running is None:
+            loop = asyncio.get_running_loop()
+            running = loop.run_in_executor(
+                self.executor,
+                transcode,
+                attachment.data.tobytes(),
+                f".{input_format}" if input_format else "",
+                output_format,
+                self.max_bytes,
+            )
+            if attachment.sha:
+                self._running[key] = running
+                running.add_done_callback(lambda _: self._running.pop(key, None))
+        data = await asyncio.shield(running)
+        if attachment.sha:
+            self._results.set(key, data)
+        return data
+
+
+transcoder = Transcoder()
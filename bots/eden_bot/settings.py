@@ -4,3 +4,6 @@ GPT3_ENGINE = "davinci"
 GPT3_TEMPERATURE = 0.9
 GPT3_FREQUENCY_PENALTY = 0.11
 GPT3_PRESENCE_PENALTY = 0.01
+
+ASSISTANT_MAX_WORKERS = 4
+ASSISTANT_MAX_QUEUE_DEPTH = 32
@@ -0,0 +1 @@
+# Lets the tests import the bots package from the repository root.
@@ -0,0 +1,105 @@
+import asyncio
+
+from bots.common.admission import FairShareQueue
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def admission_order(queue, requests):
+    # holds the only slot while everyone queues, then frees it one by one
+    first = await queue.acquire(0, 0)
+    positions = {}
+    admitted = []
+
+    async def acquire(name, user_id, guild_id):
+        async def on_position(position):
+            positions.setdefault(name, []).append(position)
+
+        ticket = await queue.acquire(user_id, guild_id, on_position=on_position)
+        admitted.append((name, ticket))
+
+    tasks = []
+    for name, user_id, guild_id in requests:
+        tasks.append(asyncio.create_task(acquire(name, user_id, guild_id)))
+        await asyncio.sleep(0)
+    await settle()
+    ranks = {name: seen[-1] for name, seen in positions.items()}
+    queue.release(first)
+    while len(admitted) < len(requests):
+        await settle()
+        assert queue.running == 1
+        queue.release(admitted[-1][1])
+    await asyncio.gather(*tasks)
+    return [name for name, _ in admitted], ranks, positions
+
+
+def test_guilds_and_users_take_turns():
+    queue = FairShareQueue(max_running=1)
+    requests = [
+        ("a1", 1, 10),
+        ("a2", 1, 10),
+        ("a3", 1, 10),
+        ("b1", 2, 10),
+        ("c1", 3, 20),
+    ]
+    order, ranks, positions = asyncio.run(admission_order(queue, requests))
+    assert order == ["a1", "c1", "b1", "a2", "a3"]
+    # once everyone has queued, the ranks match the order of admission
+    assert sorted(ranks, key=ranks.get) == order
+    # later arrivals from other users and guilds overtake the third ticket
+    assert positions["a3"] == [3, 4, 5, 4, 3, 2, 1]
+    assert queue.running == 0
+
+
+def test_guild_weights():
+    queue = FairShareQueue(max_running=1, guild_weights={10: 2})
+    requests = [
+        ("a1", 1, 10),
+        ("a2", 1, 10),
+        ("b1", 2, 10),
+        ("c1", 3, 20),
+        ("c2", 3, 20),
+    ]
+    order, _, _ = asyncio.run(admission_order(queue, requests))
+    assert order == ["a1", "b1", "c1", "a2", "c2"]
+
+
+def test_per_user_cap_lets_others_through():
+    async def run():
+        queue = FairShareQueue(max_running=4, max_per_user=1)
+        first = await queue.acquire(1, 10)
+        blocked = asyncio.create_task(queue.acquire(1, 10))
+        other = asyncio.create_task(queue.acquire(2, 10))
+        await settle()
+        assert other.done() and not blocked.done()
+        queue.release(first)
+        await settle()
+        assert blocked.done()
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        queue = FairShareQueue(max_running=1)
+        first = await queue.acquire(1, 10)
+        positions = []
+
+        async def on_position(position):
+            positions.append(position)
+
+        cancelled = asyncio.create_task(queue.acquire(2, 10))
+        waiting = asyncio.create_task(queue.acquire(3, 10, on_position=on_position))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await settle()
+        assert positions == [2, 1]
+        queue.release(first)
+        await settle()
+        assert waiting.done()
+        assert queue.running == 1
+
+    asyncio.run(run())
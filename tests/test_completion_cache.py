@@ -0,0 +1,44 @@
+import asyncio
+
+from marsbots.language_models import OpenAIGPT3LanguageModel
+
+from bots.common import completion_cache
+from bots.common.completion_cache import CompletionCache
+
+
+def make_model(**settings):
+    return OpenAIGPT3LanguageModel(api_key="test", **settings)
+
+
+def test_params_key_uses_model_settings():
+    cache = CompletionCache()
+    model = make_model(engine="text-davinci-003", temperature=0.9)
+    key = cache.params_key(model, 200, {})
+
+    assert key == cache.params_key(make_model(**vars(model.settings)), 200, {})
+    assert key != cache.params_key(make_model(engine="text-davinci-002"), 200, {})
+    assert key != cache.params_key(
+        make_model(engine="text-davinci-003", temperature=0.9, top_p=0.5), 200, {}
+    )
+    assert key != cache.params_key(model, 100, {})
+    assert key != cache.params_key(model, 200, {"stop": ["\n"]})
+
+
+def test_complete_caches_by_prompt(monkeypatch):
+    calls = []
+
+    async def complete_text(language_model, prompt, max_tokens, **kwargs):
+        calls.append(prompt)
+        return f"reply to {prompt}"
+
+    monkeypatch.setattr(completion_cache, "complete_text", complete_text)
+    cache = CompletionCache(report_every=0)
+    model = make_model(engine="text-davinci-003")
+
+    async def complete(prompt):
+        return await cache.complete(model, prompt, 200, use_content_filter=True)
+
+    assert asyncio.run(complete("hello")) == "reply to hello"
+    assert asyncio.run(complete("hello")) == "reply to hello"
+    assert asyncio.run(complete("bye")) == "reply to bye"
+    assert calls == ["hello", "bye"]
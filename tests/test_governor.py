@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from bots.common.governor import EdenGovernor
+from bots.common.governor import EdenOverloaded
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_open_governor():
+    governor = EdenGovernor(
+        base_delay=0, failure_threshold=2, reset_timeout=30, max_retries=0
+    )
+    governor._now = clock = Clock()
+
+    async def overloaded():
+        raise EdenOverloaded(503, "down")
+
+    async def trip():
+        for _ in range(2):
+            with pytest.raises(EdenOverloaded):
+                await governor.call(overloaded)
+
+    asyncio.run(trip())
+    assert governor.state == "open"
+    assert governor.opened_at == 100
+    clock.now += 30
+    assert governor.state == "half-open"
+    return governor, clock
+
+
+def test_half_open_probe_success_closes_circuit():
+    governor, _ = make_open_governor()
+    calls = []
+
+    async def run():
+        answer = asyncio.Event()
+
+        async def probe():
+            calls.append("probe")
+            await answer.wait()
+            return "ok"
+
+        async def follower():
+            calls.append("follower")
+            return "ok"
+
+        probing = asyncio.create_task(governor.call(probe))
+        await asyncio.sleep(0)
+        following = asyncio.create_task(governor.call(follower))
+        await asyncio.sleep(0)
+        # only the probe goes through while the circuit is half-open
+        assert calls == ["probe"]
+        assert governor.state == "half-open"
+        answer.set()
+        return await asyncio.gather(probing, following)
+
+    assert asyncio.run(run()) == ["ok", "ok"]
+    assert calls == ["probe", "follower"]
+    assert governor.state == "closed"
+    assert governor.failures == 0
+
+
+def test_half_open_probe_failure_reopens_circuit():
+    governor, clock = make_open_governor()
+
+    async def overloaded():
+        raise EdenOverloaded(502, "still down")
+
+    with pytest.raises(EdenOverloaded):
+        asyncio.run(governor.call(overloaded))
+    # a single failed probe is enough, and the timeout starts over
+    assert governor.state == "open"
+    assert governor.opened_at == 130
+    assert governor.failures == 3
+    clock.now += 29
+    assert governor.state == "open"
+    clock.now += 1
+    assert governor.state == "half-open"
+
+
+def test_half_open_probe_client_error_keeps_circuit_half_open():
+    governor, _ = make_open_governor()
+
+    async def bad_request():
+        raise ValueError("bad config")
+
+    with pytest.raises(ValueError):
+        asyncio.run(governor.call(bad_request))
+    assert governor.state == "half-open"
+    assert not governor._probing
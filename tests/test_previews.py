@@ -0,0 +1,58 @@
+import asyncio
+import io
+
+from PIL import Image
+
+from bots.common.media import get_filename
+from bots.common.media import MediaCache
+from bots.common.previews import PreviewRenderer
+
+
+def make_jpeg(size: int = 1024) -> bytes:
+    output = io.BytesIO()
+    Image.effect_noise((size, size), 64).convert("RGB").save(output, format="JPEG")
+    return output.getvalue()
+
+
+def test_get_filename_uses_url_then_content_type():
+    assert get_filename("https://eden.art/frame.jpg", is_video=True) == "output.jpg"
+    assert get_filename("https://eden.art/abc", "image/jpeg") == "output.jpg"
+    assert get_filename("https://eden.art/abc", "application/octet-stream") == (
+        "output.png"
+    )
+    assert get_filename("https://eden.art/abc", is_video=True) == "output.mp4"
+
+
+def test_renders_preview_for_jpg_frame_of_video_request():
+    cache = MediaCache()
+    renderer = PreviewRenderer(size=256)
+    frame_url = "https://eden.art/frames/abc"
+    cache.put(frame_url, make_jpeg(), "image/jpeg")
+    result = {"status": "running", "progress": 0.5, "output": [frame_url]}
+
+    async def render():
+        attachment, output_url = await cache.get_attachment_update(
+            result, is_video_request=True
+        )
+        return attachment, output_url, await renderer.render(attachment)
+
+    attachment, output_url, preview = asyncio.run(render())
+    assert output_url == frame_url
+    assert attachment.filename == "output.jpg"
+    assert preview.filename == "preview.webp"
+    assert len(preview) < len(attachment)
+    with Image.open(io.BytesIO(preview.data)) as image:
+        assert max(image.size) == 256
+
+
+def test_final_video_is_left_as_mp4():
+    cache = MediaCache()
+    video_url = "https://eden.art/videos/abc"
+    cache.put(video_url, b"not really a video")
+    result = {"status": "completed", "output": [video_url]}
+
+    attachment, _ = asyncio.run(
+        cache.get_attachment_update(result, is_video_request=True)
+    )
+    assert attachment.filename == "output.mp4"
+    assert not PreviewRenderer().can_render(attachment)
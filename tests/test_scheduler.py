@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from marsbots_eden.models import SignInCredentials
+from marsbots_eden.models import SourceSettings
+from marsbots_eden.models import StableDiffusionConfig
+
+from bots.common import eden
+from bots.common import scheduler
+from bots.common.governor import EdenGovernor
+from bots.common.governor import EdenOverloaded
+from bots.common.polling import PollingPolicy
+
+
+class FakeResponse:
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def text(self):
+        return str(self.body)
+
+    async def json(self):
+        return self.body
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def post(self, url, json=None, headers=None):
+        self.requests.append((url, json))
+        return FakeResponse(*self.responses.pop(0))
+
+
+def make_scheduler(governor=None, **kwargs):
+    credentials = SignInCredentials(apiKey="key", apiSecret="secret")
+    tasks = scheduler.EdenTaskScheduler("https://api.eden.art", credentials, **kwargs)
+    tasks.governor = governor or EdenGovernor(base_delay=0, failure_threshold=10)
+    return tasks
+
+
+def make_request():
+    source = SourceSettings(author_id=1, author_name="user", guild_id=2)
+    config = StableDiffusionConfig(generator_name="create", text_input="a cat")
+    return source, config
+
+
+def test_create_retries_overloaded_status(monkeypatch):
+    session = FakeSession([(429, "slow down"), (200, {"taskId": "task-1"})])
+    monkeypatch.setattr(eden, "get_session", lambda: session)
+    failures = []
+    governor = EdenGovernor(base_delay=0, failure_threshold=10)
+    record_failure = governor._record_failure
+
+    async def count_failure(probe):
+        failures.append(governor.failures + 1)
+        await record_failure(probe)
+
+    governor._record_failure = count_failure
+    tasks = make_scheduler(governor)
+
+    task_id = asyncio.run(tasks.request_creation(*make_request()))
+    assert task_id == "task-1"
+    assert len(session.requests) == 2
+    assert session.requests[0][0] == "https://api.eden.art/tasks/create"
+    assert failures == [1]
+
+
+def test_create_overload_counts_toward_circuit(monkeypatch):
+    session = FakeSession([(503, "down")] * 3)
+    monkeypatch.setattr(eden, "get_session", lambda: session)
+    governor = EdenGovernor(base_delay=0, failure_threshold=3, max_retries=2)
+    tasks = make_scheduler(governor)
+
+    with pytest.raises(EdenOverloaded):
+        asyncio.run(tasks.request_creation(*make_request()))
+    assert governor.failures == 3
+    assert governor.opened_at is not None
+
+
+def test_create_does_not_retry_client_errors(monkeypatch):
+    session = FakeSession([(400, "bad config")])
+    monkeypatch.setattr(eden, "get_session", lambda: session)
+    governor = EdenGovernor(base_delay=0)
+    tasks = make_scheduler(governor)
+
+    with pytest.raises(Exception, match="bad config"):
+        asyncio.run(tasks.request_creation(*make_request()))
+    assert len(session.requests) == 1
+    assert governor.failures == 0
+
+
+def test_poll_errors_keep_tasks_scheduled(monkeypatch):
+    answers = [
+        EdenOverloaded(502, "bad gateway"),
+        [{"taskId": "task-1", "status": "running", "progress": 0.5}],
+        [{"taskId": "task-1", "status": "completed", "output": ["url"]}],
+    ]
+
+    async def fetch_tasks(api_url, credentials, task_ids):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(scheduler, "fetch_tasks", fetch_tasks)
+    governor = EdenGovernor(base_delay=0, max_retries=0)
+    tasks = make_scheduler(governor, interval=0.001, max_backoff=0.01)
+    policy = PollingPolicy(min_interval=0, interval=0.001, max_interval=0.001)
+
+    async def watch():
+        return [result async for result in tasks.watch("task-1", policy)]
+
+    results = asyncio.run(asyncio.wait_for(watch(), 5))
+    assert [result["status"] for result in results] == ["running", "completed"]
+    assert tasks.poll_failures == 0
+    assert tasks.in_flight == 0
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from bots.common import streaming
+from bots.common.streaming import StreamingReply
+
+
+class FakeChannel:
+    id = 1
+
+
+class FakeReply:
+    def __init__(self, content):
+        self.contents = [content]
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+
+
+class FakeMessage:
+    channel = FakeChannel()
+
+    def __init__(self):
+        self.replies = []
+
+    async def reply(self, content):
+        reply = FakeReply(content)
+        self.replies.append(reply)
+        return reply
+
+
+async def edit(message, content):
+    message.contents.append(content)
+
+
+async def acquire_final(channel_id):
+    pass
+
+
+async def chunks(texts):
+    for text in texts:
+        yield text
+
+
+def stream(reply, texts):
+    return asyncio.run(reply.stream(chunks(texts)))
+
+
+@pytest.fixture(autouse=True)
+def fake_edits(monkeypatch):
+    monkeypatch.setattr(streaming.edit_coalescer, "edit", edit)
+    monkeypatch.setattr(streaming.edit_budget, "acquire_final", acquire_final)
+
+
+def make_filter(checked):
+    async def is_safe(text):
+        checked.append(text)
+        return "bad" not in text
+
+    return is_safe
+
+
+def test_checks_only_new_text_before_showing_it():
+    checked = []
+    message = FakeMessage()
+    reply = StreamingReply(message, edit_interval=0, is_safe=make_filter(checked))
+
+    final, _ = stream(reply, ["Hello", " there", " friend"])
+    assert final == "Hello there friend"
+    assert message.replies[0].contents == ["Hello", "Hello there", "Hello there friend"]
+    # one check per edit for the new text, and one for the whole at the end
+    assert checked == ["Hello", " there", " friend", "Hello there friend"]
+    assert not reply.blocked
+
+
+def test_unsafe_partial_ends_with_fallback():
+    checked = []
+    message = FakeMessage()
+
+    async def fallback():
+        return "Sorry, try talking about something else."
+
+    reply = StreamingReply(
+        message,
+        edit_interval=0,
+        is_safe=make_filter(checked),
+        fallback=fallback,
+    )
+    final, _ = stream(reply, ["Hello", " bad", " words", " more"])
+    assert reply.blocked
+    assert final == "Sorry, try talking about something else."
+    contents = message.replies[0].contents
+    assert contents == ["Hello", final]
+    assert not any("bad" in content for content in contents)
+    # nothing is checked once the stream was rejected
+    assert checked == ["Hello", " bad"]
+
+
+def test_unsafe_text_is_never_posted_without_an_edit_boundary():
+    message = FakeMessage()
+    reply = StreamingReply(message, edit_interval=60, is_safe=make_filter([]))
+
+    final, _ = stream(reply, ["all", " bad"])
+    assert reply.blocked
+    assert final == ""
+    assert message.replies == []